@@ -0,0 +1,386 @@
+import argparse
+import datetime
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# list titles known to the adapter, lists of a board cycle through them
+LIST_TITLES = ("новые", "в работе", "можно проверять", "выполнено", "архив")
+COMPLETE_FIELD_NAME = "Выполнено"
+COMPLETE_COMMENT = "Часы успешно отправлены в кабинет."
+BASE_TIME = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _time(value: datetime.datetime) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class SyntheticWekan:
+    """
+    Wekan data generated from object IDs on every request, so any number of cards takes no memory.
+
+    Every `advance` starts a new epoch in which `change_rate` of the cards get a new last-activity
+    timestamp, half of them also a new spent time.
+    """
+
+    def __init__(self,
+                 boards: int = 4,
+                 lists: int = 5,
+                 cards: int = 50,
+                 comments: int = 2,
+                 users: int = 100,
+                 completed: float = 0.3,
+                 change_rate: float = 0.1,
+                 seed: int = 0):
+        self.boards = boards
+        self.lists = lists
+        self.cards = cards
+        self.comments = comments
+        self.users = max(users, 1)
+        self.completed = completed
+        self.change_rate = change_rate
+        self.seed = seed
+        self.epoch = 0
+        self._routes = [
+            (re.compile(r'/api/users'), self.get_users),
+            (re.compile(r'/api/users/(u\d+)'), self.get_user),
+            (re.compile(r'/api/users/([^/]+)/boards'), self.get_boards),
+            (re.compile(r'/api/boards/(b\d+)'), self.get_board),
+            (re.compile(r'/api/boards/(b\d+)/lists'), self.get_lists),
+            (re.compile(r'/api/boards/(b\d+)/custom-fields'), self.get_custom_fields),
+            (re.compile(r'/api/boards/(b\d+)/lists/(b\d+l\d+)/cards'), self.get_cards),
+            (re.compile(r'/api/boards/(b\d+)/lists/(b\d+l\d+)/cards/(b\d+l\d+c\d+)'), self.get_card),
+            (re.compile(r'/api/boards/(b\d+)/cards/(b\d+l\d+c\d+)/comments'), self.get_comments),
+            (re.compile(r'/api/boards/(b\d+)/cards/(b\d+l\d+c\d+)/comments/(b\d+l\d+c\d+m\d+)'), self.get_comment),
+        ]
+
+    @property
+    def total_cards(self) -> int:
+        return self.boards * self.lists * self.cards
+
+    def advance(self) -> int:
+        """
+        Start next epoch.
+
+        :return: epoch number
+        """
+        self.epoch += 1
+        return self.epoch
+
+    def route(self, path: str) -> Optional[Any]:
+        """
+        Build response body for GET route.
+
+        :param path: requested route
+        :return: JSON-serializable body, None if route or object does not exist
+        """
+        for pattern, handler in self._routes:
+            match = pattern.fullmatch(path)
+            if match:
+                return handler(*match.groups())
+        return None
+
+    def _random(self, *key: Any) -> random.Random:
+        return random.Random(':'.join(str(i) for i in (self.seed,) + key))
+
+    def _exists(self, board_id: str, list_id: Optional[str] = None, card_id: Optional[str] = None) -> bool:
+        board = int(board_id[1:])
+        if board >= self.boards:
+            return False
+        if list_id is not None:
+            prefix, list_ = list_id.split('l')
+            if prefix != board_id or int(list_) >= self.lists:
+                return False
+        if card_id is not None:
+            prefix, card = card_id.rsplit('c', 1)
+            if not prefix.startswith(board_id + 'l') or int(card) >= self.cards:
+                return False
+            if list_id is not None and prefix != list_id:
+                return False
+        return True
+
+    def _user_id(self, rng: random.Random) -> str:
+        return f'u{rng.randrange(self.users)}'
+
+    def _completed(self, card_id: str) -> bool:
+        return self._random(card_id, 'completed').random() < self.completed
+
+    def get_users(self) -> List[Dict[str, Any]]:
+        return [{'_id': f'u{i}', 'username': f'user{i}'} for i in range(self.users)]
+
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        index = int(user_id[1:])
+        if index >= self.users:
+            return None
+        return {
+            '_id': user_id,
+            'username': f'user{index}',
+            'createdAt': _time(BASE_TIME),
+            'profile': {'fullname': f'User {index}'},
+            'emails': [{'address': f'user{index}@example.com', 'verified': True}],
+        }
+
+    def get_boards(self, user_id: str) -> List[Dict[str, Any]]:
+        return [{'_id': f'b{i}', 'title': f'Board {i}'} for i in range(self.boards)]
+
+    def get_board(self, board_id: str) -> Optional[Dict[str, Any]]:
+        if not self._exists(board_id):
+            return None
+        return {'_id': board_id, 'title': f'Board {board_id[1:]}'}
+
+    def get_lists(self, board_id: str) -> Optional[List[Dict[str, Any]]]:
+        if not self._exists(board_id):
+            return None
+        return [
+            {'_id': f'{board_id}l{i}', 'title': LIST_TITLES[i % len(LIST_TITLES)]}
+            for i in range(self.lists)
+        ]
+
+    def get_custom_fields(self, board_id: str) -> Optional[List[Dict[str, Any]]]:
+        if not self._exists(board_id):
+            return None
+        return [{'_id': f'{board_id}f', 'name': COMPLETE_FIELD_NAME, 'type': 'checkbox'}]
+
+    def get_cards(self, board_id: str, list_id: str) -> Optional[List[Dict[str, Any]]]:
+        if not self._exists(board_id, list_id):
+            return None
+        cards = []
+        for i in range(self.cards):
+            card_id = f'{list_id}c{i}'
+            rng = self._random(card_id)
+            cards.append({
+                '_id': card_id,
+                'title': f'Card {card_id}',
+                'description': '',
+                'assignees': [self._user_id(rng)],
+            })
+        return cards
+
+    def get_card(self, board_id: str, list_id: str, card_id: str) -> Optional[Dict[str, Any]]:
+        if not self._exists(board_id, list_id, card_id):
+            return None
+        rng = self._random(card_id)
+        assignees = [self._user_id(rng)]
+        if rng.random() < 0.3:
+            assignees.append(self._user_id(rng))
+        completed = self._completed(card_id)
+        created_at = BASE_TIME + datetime.timedelta(minutes=rng.randrange(60 * 24))
+        spent_time = rng.randrange(1, 40)
+
+        last_activity = created_at
+        for epoch in range(1, self.epoch + 1):
+            change = self._random(card_id, epoch).random()
+            if change < self.change_rate:
+                last_activity = BASE_TIME + datetime.timedelta(days=epoch, minutes=rng.randrange(60 * 24))
+                if change < self.change_rate / 2:
+                    spent_time += 1
+
+        return {
+            '_id': card_id,
+            'title': f'Card {card_id}',
+            'description': f'Synthetic card {card_id}',
+            'assignees': assignees,
+            'receivedAt': _time(created_at),
+            'startAt': _time(created_at),
+            'dueAt': _time(created_at + datetime.timedelta(days=7)),
+            'endAt': _time(created_at + datetime.timedelta(days=3)) if completed else None,
+            'createdAt': _time(created_at),
+            'dateLastActivity': _time(last_activity),
+            'boardId': board_id,
+            'listId': list_id,
+            'spentTime': spent_time,
+            'customFields': [{'_id': f'{board_id}f', 'value': completed}],
+        }
+
+    def get_comments(self, board_id: str, card_id: str) -> Optional[List[Dict[str, Any]]]:
+        if not self._exists(board_id, card_id=card_id):
+            return None
+        rng = self._random(card_id, 'comments')
+        completed = self._completed(card_id)
+        comments = []
+        for i in range(self.comments):
+            last = i == self.comments - 1
+            comments.append({
+                '_id': f'{card_id}m{i}',
+                'authorId': self._user_id(rng),
+                'comment': COMPLETE_COMMENT if last and completed else f'Comment {i}',
+            })
+        return comments
+
+    def get_comment(self, board_id: str, card_id: str, comment_id: str) -> Optional[Dict[str, Any]]:
+        if not self._exists(board_id, card_id=card_id) or int(comment_id.rsplit('m', 1)[1]) >= self.comments:
+            return None
+        index = int(comment_id.rsplit('m', 1)[1])
+        return {
+            '_id': comment_id,
+            'boardId': board_id,
+            'cardId': card_id,
+            'createdAt': _time(BASE_TIME + datetime.timedelta(hours=index)),
+            'userId': 'u0',
+        }
+
+
+def route_template(path: str) -> str:
+    parts = path.split('/')
+    if len(parts) > 1 and parts[1] == 'api':
+        for index in range(3, len(parts), 2):
+            parts[index] = '{id}'
+    return '/'.join(parts)
+
+
+class FakeWekanHandler(BaseHTTPRequestHandler):
+    """Serves `SyntheticWekan` data with injected latency and errors"""
+
+    server: 'FakeWekanServer'
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, do not let Nagle delay the body on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        if self.path == '/_stats':
+            self._send(200, self.server.get_stats())
+            return
+        status, body = self.server.handle(self.path)
+        self._send(status, body)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self.path == '/_epoch':
+            self._send(200, {'epoch': self.server.data.advance()})
+        elif self.path == '/users/login':
+            status, body = self.server.handle(self.path, login=True)
+            self._send(status, body)
+        else:
+            self._send(404, None)
+
+    def _send(self, status: int, body: Any) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class FakeWekanServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self,
+                 address: Tuple[str, int],
+                 data: SyntheticWekan,
+                 latency: float = 0,
+                 error_rate: float = 0,
+                 seed: int = 0):
+        super().__init__(address, FakeWekanHandler)
+        self.data = data
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests: Counter = Counter()
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def handle(self, path: str, login: bool = False) -> Tuple[int, Any]:
+        """
+        Answer request after injected latency, failing `error_rate` of them with 500.
+
+        :param path: requested route
+        :param login: answer with token
+        :return: status and body
+        """
+        with self._lock:
+            self.requests[route_template(path)] += 1
+            delay = self.latency * self._random.uniform(0.5, 1.5) if self.latency else 0
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return 500, {'error': 'injected', 'reason': 'Injected error'}
+        if login:
+            expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+            return 200, {'id': 'u0', 'token': 'benchmark', 'tokenExpires': _time(expires)}
+        body = self.data.route(path)
+        return (200, body) if body is not None else (404, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': sum(self.requests.values()),
+                'errors': self.errors,
+                'routes': dict(self.requests),
+                'epoch': self.data.epoch,
+            }
+
+
+def serve(data: SyntheticWekan,
+          host: str = '127.0.0.1',
+          port: int = 0,
+          latency: float = 0,
+          error_rate: float = 0,
+          ready: Any = None) -> None:
+    """
+    Run fake Wekan server until the process is stopped.
+
+    :param data: synthetic data
+    :param host: host to listen on
+    :param port: port to listen on, 0 for any free one
+    :param latency: mean injected latency in seconds
+    :param error_rate: share of requests answered with 500
+    :param ready: connection to send the bound port to
+    :return: None
+    """
+    server = FakeWekanServer((host, port), data, latency, error_rate, data.seed)
+    if ready is not None:
+        ready.send(server.server_address[1])
+    server.serve_forever()
+
+
+def add_data_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--boards", type=int, default=4, help="number of boards")
+    parser.add_argument("--lists", type=int, default=5, help="lists per board")
+    parser.add_argument("--cards", type=int, default=50, help="cards per list")
+    parser.add_argument("--comments", type=int, default=2, help="comments per card")
+    parser.add_argument("--users", type=int, default=100, help="number of users")
+    parser.add_argument("--completed", type=float, default=0.3, help="share of completed cards")
+    parser.add_argument("--change-rate", type=float, default=0.1, help="share of cards changed per epoch")
+    parser.add_argument("--latency", type=float, default=0, help="mean latency per request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests failing with 500")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated data and injected errors")
+
+
+def make_data(args: argparse.Namespace) -> SyntheticWekan:
+    return SyntheticWekan(
+        boards=args.boards,
+        lists=args.lists,
+        cards=args.cards,
+        comments=args.comments,
+        users=args.users,
+        completed=args.completed,
+        change_rate=args.change_rate,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic Wekan REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_data_arguments(parser)
+    args = parser.parse_args()
+    print(f"Fake Wekan with {args.boards * args.lists * args.cards} cards on {args.host}:{args.port}")
+    serve(make_data(args), args.host, args.port, args.latency, args.error_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+End-to-end sync benchmark against a synthetic Wekan served from a separate process.
+
+Run from the repository root:
+
+    python -m benchmarks.run --boards 20 --lists 5 --cards 1000 --runs 2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import urllib.request
+from typing import Any, Dict
+
+from dotenv import dotenv_values
+
+from benchmarks.fake_wekan import add_data_arguments, make_data, serve
+
+# settings the adapter requires, used unless they are set in the environment or .env
+DEFAULT_ENV = {
+    'WEKAN_USERNAME': 'benchmark',
+    'WEKAN_PASSWORD': 'benchmark',
+    'WEKAN_ADMIN_USER': 'u0',
+    'WEKAN_BASE_URL': 'http://127.0.0.1',
+    'MONGO_USER': '',
+    'MONGO_PASSWORD': '',
+    'MONGO_HOST': 'localhost',
+    'MONGO_PORT': '27017',
+    'MONGO_DB': 'wekan_benchmark',
+}
+
+# key of the REST module in `scripts.api.backends.BACKENDS`
+REST_SOURCE = 'rest'
+
+# collections written by the adapter, emptied before a benchmark against a real database
+ADAPTER_COLLECTIONS = ('Card', 'CardComment', 'CardFingerprint', 'BoardInfo', 'SyncRun', 'SyncCheckpoint',
+                       'BoardSchedule')
+
+
+def _call(base_url: str, route: str, method: str = 'GET') -> Dict[str, Any]:
+    request = urllib.request.Request(f'{base_url}{route}', method=method, data=b'' if method == 'POST' else None)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _connect(args: argparse.Namespace) -> None:
+    from scripts import database
+    from scripts.config import config
+
+    if args.mongo == 'memory':
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("In-memory database needs mongomock: pip install mongomock, or use --mongo config")
+        import mongoengine
+        mongoengine.connect(args.mongo_db, mongo_client_class=mongomock.MongoClient)
+    else:
+        database.connect(
+            username=config.MONGO_USER,
+            password=config.MONGO_PASSWORD,
+            ip=config.MONGO_HOST,
+            port=config.MONGO_PORT,
+            db=args.mongo_db
+        )
+        for name in ADAPTER_COLLECTIONS:
+            getattr(database, name).drop_collection()
+
+    # database users matching the synthetic Wekan users by slug
+    users = database.User._get_collection()
+    users.delete_many({'slug': {'$regex': '^user[0-9]+$'}})
+    users.insert_many([{'slug': f'user{i}'} for i in range(args.users)])
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Start fake Wekan, sync it `args.runs` times and measure every run.
+
+    :param args: parsed command line
+    :return: report with a result per run
+    """
+    data = make_data(args)
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    server = multiprocessing.Process(
+        target=serve,
+        args=(data, '127.0.0.1', 0, args.latency, args.error_rate, sender),
+        daemon=True,
+    )
+    server.start()
+    base_url = f'http://127.0.0.1:{receiver.recv()}'
+
+    files = {**dotenv_values('.env.shared'), **dotenv_values('.env')}
+    for key, value in DEFAULT_ENV.items():
+        if key not in files:
+            os.environ.setdefault(key, value)
+    # settings read when scripts are imported, the fake Wekan is served through the REST routes only
+    os.environ['WEKAN_BASE_URL'] = base_url
+    os.environ['WEKAN_SOURCE'] = REST_SOURCE
+    os.environ['MONGO_DB'] = args.mongo_db
+
+    from scripts import adapter, api, sync
+    from scripts.config import config
+    from scripts.metrics import metrics
+
+    if args.mongo == 'memory':
+        # worker processes would not see the in-memory database of this one
+        config.SYNC_PROCESSES = 1
+    _connect(args)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    report = {'cards': data.total_cards, 'settings': vars(args), 'runs': []}
+    try:
+        token = api.backend.login(config.WEKAN_USERNAME, config.WEKAN_PASSWORD)
+        started = time.perf_counter()
+        users = adapter.get_user_directory(token)
+        report['users_seconds'] = round(time.perf_counter() - started, 3)
+
+        for number in range(args.runs):
+            if number:
+                _call(base_url, '/_epoch', 'POST')
+            metrics.pop()
+            before = _call(base_url, '/_stats')
+            started = time.perf_counter()
+            stats = sync.sync_boards(token, users)
+            elapsed = time.perf_counter() - started
+            after = _call(base_url, '/_stats')
+
+            summary = metrics.summary()
+            scanned = sum(board['scanned'] for board in summary['boards'].values())
+            requests = after['requests'] - before['requests']
+            result = {
+                'run': number + 1,
+                'seconds': round(elapsed, 3),
+                'cards_scanned': scanned,
+                'cards_updated': sum(board['updated'] for board in summary['boards'].values()),
+                'cards_written': stats.matched + stats.upserted,
+                'cards_skipped': stats.skipped,
+                'cards_failed': stats.failed,
+                'cards_per_second': round(scanned / elapsed, 1) if elapsed else 0,
+                'requests': requests,
+                'requests_per_card': round(requests / scanned, 2) if scanned else 0,
+                'injected_errors': after['errors'] - before['errors'],
+                'peak_rss_mb': round(_peak_rss_mb(), 1),
+                'stages': summary['stages'],
+            }
+            if args.tracemalloc:
+                result['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+                tracemalloc.reset_peak()
+            report['runs'].append(result)
+    finally:
+        server.terminate()
+    return report
+
+
+def _print(report: Dict[str, Any]) -> None:
+    print(f"{report['cards']} cards, user directory loaded in {report['users_seconds']}s")
+    columns = ('run', 'seconds', 'cards_per_second', 'requests_per_card', 'cards_updated',
+               'cards_written', 'cards_skipped', 'injected_errors', 'peak_rss_mb')
+    if report['runs'] and 'peak_traced_mb' in report['runs'][0]:
+        columns += ('peak_traced_mb',)
+    print(' '.join(f'{column:>17}' for column in columns))
+    for result in report['runs']:
+        print(' '.join(f'{result[column]:>17}' for column in columns))
+        stages = ', '.join(f"{name} {stage['seconds']}s" for name, stage in result['stages'].items())
+        print(f"  stages: {stages}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Wekan adapter sync benchmark")
+    add_data_arguments(parser)
+    parser.add_argument("--runs", type=int, default=2,
+                        help="number of syncs, every run after the first one sees --change-rate changed cards")
+    parser.add_argument("--mongo", choices=('memory', 'config'), default='memory',
+                        help="in-memory mongomock or MongoDB server from MONGO_* settings")
+    parser.add_argument("--mongo-db", default='wekan_benchmark',
+                        help="database name, its adapter collections are emptied on the server")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak of Python allocations (slower)")
+    parser.add_argument("--json", help="write report to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    _print(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,31 @@
 from scripts.config import config
-from scripts.api import api
-from scripts import adapter, database
+from scripts import adapter, api, database, sync
+from scripts.daemon import Daemon
+from scripts.metrics import MetricsServer, metrics
+from scripts.profiler import PROFILERS, SamplingProfiler, format_summary
+from scripts.webhooks import WebhookReceiver
 
+import argparse
 import logging
 import logging.handlers
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Wekan adapter")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and sync every SYNC_INTERVAL seconds")
+    parser.add_argument("--webhooks", action="store_true",
+                        help="refresh cards from Wekan webhooks, full sync every WEBHOOK_RECONCILE_INTERVAL seconds")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="profile the run by stage, writing flame graph stacks and hotspot summary to DIR")
+    parser.add_argument("--profile-mode", choices=sorted(PROFILERS), default=SamplingProfiler.mode,
+                        help="low-overhead stack sampling (collapsed stacks) or cProfile (pstats per stage)")
+    parser.add_argument("--profile-interval", type=float, default=0.005,
+                        help="seconds between stack samples")
+    parser.add_argument("--profile-top", type=int, default=20,
+                        help="number of hottest functions listed per stage")
+    args = parser.parse_args()
+
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s [%(levelname)s] %(message)s",
@@ -33,13 +52,45 @@ def main():
         db=config.MONGO_DB
     )
 
-    token = api.login(config.WEKAN_USERNAME, config.WEKAN_PASSWORD)
-    for board in api.get_boards_from_user(config.WEKAN_ADMIN_USER, token):
-        cards_last_activity = adapter.get_cards_activity_board(board)
-        db_cards = adapter.get_updated_cards(board, cards_last_activity, token)
-        adapter.map_users_with_db(board, db_cards, token)
-    
-    logging.info(f"'{len(db_cards)}' cards were added or updated")
+    if config.METRICS_PORT:
+        MetricsServer((config.METRICS_HOST, config.METRICS_PORT), metrics).start()
+
+    profiler = None
+    if args.profile:
+        if config.SYNC_PROCESSES > 1:
+            logging.warning("Worker processes are not profiled, boards are synced in this process")
+            config.SYNC_PROCESSES = 1
+        if args.profile_mode == SamplingProfiler.mode:
+            profiler = SamplingProfiler(args.profile_interval)
+        else:
+            profiler = PROFILERS[args.profile_mode]()
+        profiler.start()
+
+    try:
+        if args.webhooks:
+            daemon = Daemon(interval=config.WEBHOOK_RECONCILE_INTERVAL)
+            receiver = WebhookReceiver(daemon)
+            receiver.start()
+            try:
+                daemon.run()
+            finally:
+                receiver.stop()
+        elif args.daemon:
+            Daemon().run()
+        else:
+            with metrics.stage('login'):
+                token = api.backend.login(config.WEKAN_USERNAME, config.WEKAN_PASSWORD)
+            users = adapter.get_user_directory(token)
+            stats = sync.sync_boards(token, users)
+
+            logging.info(f"'{stats.matched + stats.upserted}' cards were added or updated, "
+                         f"'{stats.skipped}' unchanged cards were not written")
+            metrics.export(config.METRICS_PATH, config.METRICS_SUMMARY_PATH)
+    finally:
+        api.store.close()
+        if profiler is not None:
+            profiler.stop()
+            logging.info(format_summary(profiler.write(args.profile, args.profile_top)))
     logging.info(f"Program finished")
 
     database.disconnect()
@@ -1,9 +1,17 @@
 import datetime
 import logging
 import sys
-from typing import Dict, List, Tuple, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from pymongo import UpdateOne
 
 from scripts import api, database
+from scripts.boards import board_metadata
+from scripts.config import config
+from scripts.metrics import metrics
+from scripts.users import UserDirectory, get_user_slug
 
 # to get status use `LIST_NAMES_TO_STATUS.get(name, database.StatusEnum.UNKNOWN)`
 LIST_NAMES_TO_STATUS = {
@@ -15,68 +23,169 @@ LIST_NAMES_TO_STATUS = {
 }
 
 
-def get_list_cards(board: Union[str, api.InlineBoard],
-                   list_: Union[str, api.InlineList],
-                   token: Union[str, api.InlineToken]) -> List[api.Card]:
+class CardState(NamedTuple):
+    """Stored card fields needed to detect changes"""
+    last_activity: Union[datetime.datetime, None]
+    has_title: bool
+    fingerprint: Optional[str] = None
+
+
+def get_list_card(board: Union[str, api.InlineBoard],
+                  list_: Union[str, api.InlineList],
+                  card: Union[str, api.InlineCard, api.Card],
+                  token: Union[str, api.InlineToken]) -> Union[api.Card, None]:
     """
-    Get cards from board's list.
+    Get full card info, ignoring cards answered with empty response.
 
     :param board: board ID (as string) or Board object
     :param list_: list ID (as string) or List object
+    :param card: card ID (as string) or Card object
     :param token: token
-    :return: list of cards
+    :return: card or None
+    """
+    if isinstance(card, api.Card):
+        return card
+    try:
+        with metrics.stage('card-fetch'):
+            return api.backend.get_card(board, list_, card, token)
+    except api.RouteError as e:
+        if e.status != 204:
+            raise e
+    return None
+
+
+def get_list_card_refs(board: Union[str, api.InlineBoard],
+                       list_: Union[str, api.InlineList],
+                       token: Union[str, api.InlineToken]) -> Iterable[Union[str, api.Card]]:
+    """
+    Get cards of the list to pass to `get_list_card`: full cards if backend lists them in full, IDs otherwise.
+
+    Full cards are streamed, so only a batch of them is held in memory.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param token: token
+    :return: card IDs or cards
+    """
+    if api.backend.FULL_COLLECTIONS:
+        return api.backend.iter_all_cards(board, list_, token)
+    with metrics.stage('list-scan'):
+        return api.backend.get_all_card_ids(board, list_, token)
+
+
+def iter_list_cards(board: Union[str, api.InlineBoard],
+                    list_: Union[str, api.InlineList],
+                    token: Union[str, api.InlineToken],
+                    workers: Optional[int] = None) -> Iterator[api.Card]:
+    """
+    Iterate over cards from board's list, keeping at most `2 * workers` requests in flight.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param token: token
+    :param workers: number of concurrent card requests, `config.WEKAN_CARD_WORKERS` by default
+    :return: iterator of cards in list order
+    """
+    workers = config.WEKAN_CARD_WORKERS if workers is None else workers
+
+    list_cards = get_list_card_refs(board, list_, token)
+    if api.backend.FULL_COLLECTIONS:
+        yield from list_cards
+        return
+    if workers <= 1 or len(list_cards) <= 1:
+        all_cards = (get_list_card(board, list_, card, token) for card in list_cards)
+        yield from (card for card in all_cards if card is not None)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(list_cards))) as executor:
+        pending = deque()
+        for card in list_cards:
+            pending.append(executor.submit(get_list_card, board, list_, card, token))
+            if len(pending) >= 2 * workers:
+                card = pending.popleft().result()
+                if card is not None:
+                    yield card
+        while pending:
+            card = pending.popleft().result()
+            if card is not None:
+                yield card
+
+
+def get_cards_comments(board: api.InlineBoard,
+                       cards: List[api.Card],
+                       token: Union[str, api.InlineToken]) -> Dict[str, List[api.InlineComment]]:
     """
-    all_cards = []
+    Load comments of several cards at once if backend supports it (`BULK_COMMENTS`).
 
-    list_cards = api.get_all_cards(board, list_, token)
-    for card in list_cards:
-        try:
-            all_cards.append(api.get_card(board, list_, card, token))
-        except api.RouteError as e:
-            if e.status != 204:
-                raise e
-    return all_cards
+    :param board: board ID (as Board object)
+    :param cards: cards of the board
+    :param token: token
+    :return: comments of each card, empty if they are loaded per card
+    """
+    if not api.backend.BULK_COMMENTS or not cards:
+        return {}
+    with metrics.stage('comments'):
+        return api.backend.get_cards_comments(board, cards, token)
 
 
 def get_card_timestamp(board: Union[str, api.InlineBoard],
                        card: Union[str, api.Card],
-                       token: Union[str, api.InlineToken]) -> Union[datetime.datetime, None]:
+                       token: Union[str, api.InlineToken],
+                       comments: Optional[List[api.InlineComment]] = None) -> Union[datetime.datetime, None]:
     """
     Get card's completion timestamp.
 
+    Comments seen before are resolved from `database.CardComment`, only new ones are requested.
+
     :param board: board ID (as string) or Board object
     :param card: card ID (as string) or Card object
     :param token: token
+    :param comments: comments of the card loaded by `get_cards_comments`, requested from backend if not given
     :return: timestamp
     """
-    all_comments = api.get_all_comments(board, card, token)
-    timestamp = None
-    if all_comments:
-        try:
-            for j in all_comments:
-                if j.comment.find('Часы успешно отправлены в кабинет.') != - 1:
-                    current_comment = api.get_comment(board, card, j.id, token)
-                    timestamp = current_comment.created_at
-        except api.RouteError as e:
-            if e.status != 204:
-                raise e
-    return timestamp
+    with metrics.stage('comments'):
+        return _get_card_timestamp(board, card, token, comments)
 
 
-def get_complete_field_id(board: Union[str, api.InlineBoard],
-                          token: Union[str, api.InlineToken]) -> Union[str, None]:
-    """
-    Get complete field id from board custom fields.
+def _get_card_timestamp(board: Union[str, api.InlineBoard],
+                        card: Union[str, api.Card],
+                        token: Union[str, api.InlineToken],
+                        comments: Optional[List[api.InlineComment]] = None) -> Union[datetime.datetime, None]:
+    board_id = board.id if isinstance(board, (api.InlineBoard,)) else board
+    card_id = card.id if isinstance(card, (api.Card,)) else card
 
-    :param board: board ID (as string) or Board object
-    :param token: token
-    :return: complete field id
-    """
-    custom_fields = api.get_all_custom_fields(board, token)
-    for field in custom_fields:
-        if field.name == "Выполнено":
-            return field.id
-    return None
+    timestamp = None
+    seen_comments = None
+    new_comments = []
+    try:
+        if comments is None:
+            comments = api.backend.iter_all_comments(board, card, token)
+        for j in comments:
+            if seen_comments is None:
+                seen_comments = {
+                    comment.comment_id: comment.completed_at
+                    for comment in database.CardComment.objects(board_id=board_id, card_id=card_id).only('comment_id', 'completed_at')
+                }
+            if j.id in seen_comments:
+                completed_at = seen_comments[j.id]
+            else:
+                completed_at = None
+                if j.comment.find('Часы успешно отправлены в кабинет.') != - 1:
+                    completed_at = api.backend.get_comment(board, card, j.id, token).created_at
+                new_comments.append(UpdateOne(
+                    {'board_id': board_id, 'card_id': card_id, 'comment_id': j.id},
+                    {'$set': {'completed_at': completed_at}},
+                    upsert=True,
+                ))
+            if completed_at is not None:
+                timestamp = completed_at
+    except api.RouteError as e:
+        if e.status != 204:
+            raise e
+    if new_comments:
+        # upserts, so a sync running concurrently may save the same comments
+        database.CardComment._get_collection().bulk_write(new_comments, ordered=False)
+    return timestamp
 
 
 def get_card_complete_status(complete_field_id: str,
@@ -94,24 +203,81 @@ def get_card_complete_status(complete_field_id: str,
     return False
 
 
-def get_users(token: Union[str, api.InlineToken]) -> Dict[str, api.User]:
+def get_users(token: Union[str, api.InlineToken],
+              workers: Optional[int] = None) -> Dict[str, api.User]:
     """
     Get all users.
 
     :param token: token
+    :param workers: number of concurrent user requests, `config.WEKAN_USER_WORKERS` by default
     :return: dictionary of users
     """
-    users = {}
-    for user in api.get_all_users(token):
-        users[user.id] = api.get_user(user, token)
+    workers = config.WEKAN_USER_WORKERS if workers is None else workers
+
+    if api.backend.FULL_COLLECTIONS:
+        return {user.id: user for user in api.backend.iter_all_users(token)}
+
+    user_ids = api.backend.get_all_user_ids(token)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        return dict(zip(user_ids, executor.map(lambda user_id: api.backend.get_user(user_id, token), user_ids)))
+
+
+def get_user_directory(token: Union[str, api.InlineToken]) -> UserDirectory:
+    """
+    Get directory of all users, reusing on-disk snapshot if it is fresh.
+
+    :param token: token
+    :return: user directory
+    """
+    if config.USERS_SNAPSHOT_PATH:
+        users = UserDirectory.load_snapshot(config.USERS_SNAPSHOT_PATH, config.USERS_SNAPSHOT_TTL)
+        if users is not None:
+            return users
+
+    users = UserDirectory({user_id: get_user_slug(user) for user_id, user in get_users(token).items()})
+    logging.info(f"{len(users.slugs)} user(s) loaded from Wekan")
+    if config.USERS_SNAPSHOT_PATH:
+        users.save_snapshot(config.USERS_SNAPSHOT_PATH)
     return users
 
 
+def map_card_fields(board: api.InlineBoard,
+                    list_: api.InlineList,
+                    card: api.Card,
+                    complete_field_id: str) -> database.Card:
+    """
+    Map data from api to database without resolving timestamp from comments.
+
+    :param board: board ID (as Board object)
+    :param list_: list ID (as List object)
+    :param card: card ID (as Card object)
+    :param complete_field_id: field ID (as string)
+    :return: card as database object
+    """
+    with metrics.stage('card-map'):
+        db_card = database.Card(board_id=board.id, card_id=card.id)
+
+        db_card.status = LIST_NAMES_TO_STATUS.get(list_.title, database.StatusEnum.UNKNOWN)
+        db_card.completed = get_card_complete_status(complete_field_id, card)
+        db_card.last_activity = card.date_last_activity
+
+        db_card.info = database.CardInfo()
+        db_card.info.title = card.title
+        db_card.info.hours = card.spent_time if card.spent_time is not None and card.spent_time < sys.maxsize else 0
+        db_card.info.assignees = card.assignees
+        db_card.info.start_at = card.start_at
+        db_card.info.due_at = card.due_at
+        db_card.info.end_at = card.end_at
+        db_card.info.received_at = card.received_at
+    return db_card
+
+
 def map_card_to_database(board: api.InlineBoard,
                          list_: api.InlineList,
                          card: api.Card,
                          complete_field_id: str,
-                         token: Union[str, api.InlineToken]) -> database.Card:
+                         token: Union[str, api.InlineToken],
+                         comments: Optional[List[api.InlineComment]] = None) -> database.Card:
     """
     Map data from api to database.
 
@@ -120,101 +286,171 @@ def map_card_to_database(board: api.InlineBoard,
     :param card: card ID (as Card object)
     :param complete_field_id: field ID (as string)
     :param token: token
+    :param comments: comments of the card loaded by `get_cards_comments`, requested from backend if not given
     :return: card as database object
     """
-    search_card = database.Card.objects(board_id=board.id, card_id=card.id)
-    db_card = search_card[0] if search_card else database.Card(board_id=board.id, card_id=card.id)
+    db_card = map_card_fields(board, list_, card, complete_field_id)
+    db_card.info.timestamp = get_card_timestamp(board, card, token, comments)
+    return db_card
+
+
+def map_cards_to_database(board: api.InlineBoard,
+                          list_: api.InlineList,
+                          cards: List[api.Card],
+                          complete_field_id: str,
+                          token: Union[str, api.InlineToken]) -> List[database.Card]:
+    """
+    Map cards of one list, loading comments of all of them at once if backend supports it.
+
+    :param board: board ID (as Board object)
+    :param list_: list ID (as List object)
+    :param cards: cards of the list
+    :param complete_field_id: field ID (as string)
+    :param token: token
+    :return: cards as database objects
+    """
+    comments = get_cards_comments(board, cards, token)
+    return [
+        map_card_to_database(board, list_, card, complete_field_id, token, comments.get(card.id))
+        for card in cards
+    ]
 
-    db_card.status = LIST_NAMES_TO_STATUS.get(list_.title, database.StatusEnum.UNKNOWN)
-    db_card.completed = get_card_complete_status(complete_field_id, card)
-    db_card.last_activity = card.date_last_activity
 
-    db_card.info = database.CardInfo()
-    db_card.info.title = card.title
-    db_card.info.hours = card.spent_time if card.spent_time is not None and card.spent_time < sys.maxsize else 0
-    db_card.info.timestamp = get_card_timestamp(board, card, token)
-    db_card.info.assignees = card.assignees
-    db_card.info.start_at = card.start_at
-    db_card.info.due_at = card.due_at
-    db_card.info.end_at = card.end_at
-    db_card.info.received_at = card.received_at
+def is_card_updated(card: api.Card,
+                    cards_state: Dict[str, CardState]) -> bool:
+    """
+    Check if card differs from its stored state.
 
-    return db_card
+    :param card: card ID (as Card object)
+    :param cards_state: stored state for each card ID of the board
+    :return: True if card is new, changed or stored without title
+    """
+    state = cards_state.get(card.id)
+    return state is None or \
+        state.last_activity is None or \
+        state.last_activity.utctimetuple() != card.date_last_activity.utctimetuple() or \
+        not state.has_title
+
+
+def get_cards_fingerprints(cards_state: Dict[str, CardState]) -> Dict[str, str]:
+    """
+    Get fingerprints of saved cards for `CardWriter` to skip unchanged cards.
+
+    :param cards_state: stored state for each card ID of the board
+    :return: fingerprint for each card ID, cards stored without title are left out to be rewritten
+    """
+    return {
+        card_id: state.fingerprint
+        for card_id, state in cards_state.items()
+        if state.has_title and state.fingerprint is not None
+    }
+
+
+def iter_list_updated_cards(board: api.InlineBoard,
+                            list_: api.InlineList,
+                            complete_field_id: Optional[str],
+                            cards_state: Dict[str, CardState],
+                            token: Union[str, api.InlineToken]) -> Iterator[database.Card]:
+    """
+    Iterate over cards of the list with updated last-activity timestamp, mapping them as they are fetched.
+
+    :param board: board ID (as Board object)
+    :param list_: list ID (as List object)
+    :param complete_field_id: complete field id
+    :param cards_state: stored state for each card ID of the board
+    :param token: token
+    :return: iterator of cards
+    """
+    scanned = updated = 0
+    # with bulk comments updated cards are mapped in batches, one comment query per batch
+    batch = []
+    try:
+        for card in iter_list_cards(board, list_, token):
+            scanned += 1
+            if not is_card_updated(card, cards_state):
+                continue
+            updated += 1
+            if not api.backend.BULK_COMMENTS:
+                yield map_card_to_database(board, list_, card, complete_field_id, token)
+                continue
+            batch.append(card)
+            if len(batch) >= config.MONGO_BATCH_SIZE:
+                yield from map_cards_to_database(board, list_, batch, complete_field_id, token)
+                batch = []
+        yield from map_cards_to_database(board, list_, batch, complete_field_id, token)
+    finally:
+        metrics.count_cards(board.id, scanned, updated)
+
+
+def iter_updated_cards(board: api.InlineBoard,
+                       cards_state: Dict[str, CardState],
+                       token: Union[str, api.InlineToken]) -> Iterator[database.Card]:
+    """
+    Iterate over cards of all lists with updated last-activity timestamp, see `iter_list_updated_cards`.
+
+    Lists and the complete field come from `board_metadata` cache.
+
+    :param board: board ID (as Board object)
+    :param cards_state: stored state for each card ID of the board
+    :param token: token
+    :return: iterator of cards
+    """
+    metadata = board_metadata.get(board, token)
+    for list_ in metadata.lists:
+        yield from iter_list_updated_cards(board, list_, metadata.complete_field_id, cards_state, token)
 
 
 def get_updated_cards(board: api.InlineBoard,
-                      cards_last_activity: Dict[Tuple[str, str], datetime.datetime],
+                      cards_state: Dict[str, CardState],
                       token: Union[str, api.InlineToken]) -> List[database.Card]:
     """
     Get cards with updated last-activity timestamp.
 
     :param board: board ID (as Board object)
-    :param cards_last_activity: dictionary of last activity for each card
+    :param cards_state: stored state for each card ID of the board
     :param token: token
     :return: list of cards
     """
-    updated_cards = []
-    complete_field_id = get_complete_field_id(board, token)
-    board_lists = api.get_all_lists(board, token)
-    for list_ in board_lists:
-        for card in get_list_cards(board, list_, token):
-            if (card.board_id, card.id) not in cards_last_activity or \
-                    cards_last_activity[(card.board_id, card.id)].utctimetuple() != card.date_last_activity.utctimetuple() or \
-                    not database.Card.objects(card_id=card.id)[0].info.title:
-                updated_cards.append(map_card_to_database(board, list_, card, complete_field_id, token))
-    return updated_cards
+    return list(iter_updated_cards(board, cards_state, token))
 
 
-def map_users_with_db(board: api.InlineBoard,
-                        db_cards: List[database.Card],
-                        token: api.InlineToken) -> None:
+def map_card_users(card: database.Card,
+                   users: UserDirectory,
+                   token: Union[str, api.InlineToken]) -> database.Card:
     """
-    Save users to database.
+    Link card assignees to database users.
 
-    :param board: board ID (as Board object)
-    :param db_cards: list of cards
+    :param card: card as database object
+    :param users: user directory
     :param token: token
-    :return: None
+    :return: the same card
     """
-    for card in db_cards:
+    with metrics.stage('user-map'):
         assignees = []
         for assignee in card.info.assignees:
-            user = api.get_user(assignee, token)
-            if user.emails:
-                slug = user.emails[0].address.split("@")[0]
-                search_slug_user = database.User.objects(slug=slug)
-                if search_slug_user:
-                    assignees.append(search_slug_user[0])
-                else:
-                    logging.warning('No such user in database.')
+            user = users.resolve(assignee, token)
+            if user is not None:
+                assignees.append(user)
         card.users = assignees
-        try:
-            card.save()
-        except OverflowError as e:
-            logging.warning(e.args[0])
-    logging.info(f"{len(db_cards)} card(s) from board '{board.id}' saved")
-
-
-def get_cards_last_activity() -> Dict[Tuple[str, str], datetime.datetime]:
-    """
-    Get card last activity.
-
-    :return: dictionary of last activity for each card
-    """
-    cards_last_activity = {}
-    for card in database.Card.objects():
-        cards_last_activity[(card.board_id, card.card_id)] = card.last_activity
-    return cards_last_activity
+    return card
 
 
-def get_cards_activity_board(board: api.InlineBoard) -> Dict[Tuple[str, str], datetime.datetime]:
+def get_cards_state_board(board: api.InlineBoard) -> Dict[str, CardState]:
     """
-    Get card last activity.
+    Get stored state of board's cards with one projected query per collection.
 
     :param board: board ID (as Board object)
-    :return: dictionary of last activity for each card
+    :return: state for each card ID
     """
-    cards_activity = {}
-    for card in database.Card.objects(board_id__exact=board.id):
-        cards_activity[(board.id, card.card_id)] = card.last_activity
-    return cards_activity
+    fingerprints = {
+        i['card_id']: i['fingerprint']
+        for i in database.CardFingerprint.objects(board_id=board.id).only('card_id', 'fingerprint').as_pymongo()
+    }
+    cards_state = {}
+    for card in database.Card.objects(board_id__exact=board.id).only('card_id', 'last_activity', 'info.title').as_pymongo():
+        cards_state[card['card_id']] = CardState(
+            last_activity=card.get('last_activity'),
+            has_title=bool(card.get('info', {}).get('title')),
+            fingerprint=fingerprints.get(card['card_id']),
+        )
+    return cards_state
@@ -1,8 +1,13 @@
-from .api import (LoginError, RouteError, get_all_cards, get_all_comments,
-                  get_all_custom_fields, get_all_lists, get_all_users,
-                  get_board, get_boards_from_user, get_card, get_comment,
-                  get_user, login)
+from .api import (LoginError, RouteError, get_all_card_ids, get_all_cards,
+                  get_all_comments, get_all_custom_fields, get_all_lists,
+                  get_all_user_ids, get_all_users, get_board,
+                  get_boards_from_user, get_card, get_comment, get_user,
+                  iter_all_cards, iter_all_comments, iter_all_users, login)
 from .responses import (Card, Comment, CustomFieldValue, InlineApiError,
                         InlineBoard, InlineCard, InlineComment,
                         InlineCustomField, InlineList, InlineToken, InlineUser,
                         User)
+from .store import ResponseStore, StoredResponse, store
+from .limiter import AdaptiveLimiter, Limiter, TokenBucket
+from .transport import Transport, transport
+from .backends import backend
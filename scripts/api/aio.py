@@ -0,0 +1,361 @@
+import asyncio
+import datetime
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import aiohttp
+
+from ..config import config
+from ..metrics import metrics
+from .api import LoginError, RouteError
+from .limiter import Limiter
+from .responses import *
+from .store import REPLAY, store
+from .transport import Transport, get_retry_delay, transport
+
+
+class AsyncTransport:
+    """
+    Event-loop-wide aiohttp session with a shared concurrency semaphore.
+
+    Every attempt passes `limiter`, the same one as the threaded transport by default.
+    """
+
+    def __init__(self,
+                 base_url: str,
+                 pool_size: int = 100,
+                 concurrency: int = 64,
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 timeout: Optional[float] = 30,
+                 limiter: Optional[Limiter] = None):
+        self.base_url = base_url
+        self.limiter = limiter or transport.limiter
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=self.timeout,
+        )
+
+    async def request(self,
+                      method: str,
+                      route: str,
+                      **kwargs: Any) -> Tuple[int, bytes]:
+        """
+        Send request to the API, retrying 5xx answers and connection errors.
+
+        :param method: HTTP method
+        :param route: requested route
+        :param kwargs: extra arguments for `aiohttp.ClientSession.request`
+        :return: status code and raw body
+        """
+        attempt = 0
+        async with self.semaphore:
+            while True:
+                retry_after = None
+                await self.limiter.acquire_async()
+                started = time.monotonic()
+                status = None
+                try:
+                    async with self.session.request(method, f'{self.base_url}{route}', **kwargs) as response:
+                        body = await response.read()
+                        status = response.status
+                        retry_after = response.headers.get('Retry-After')
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt >= self.retries:
+                        raise
+                finally:
+                    self.limiter.release(time.monotonic() - started, status)
+                if status is not None and (status not in Transport.RETRY_STATUSES or attempt >= self.retries):
+                    return status, body
+                await asyncio.sleep(get_retry_delay(attempt, self.backoff, retry_after))
+                attempt += 1
+
+    async def close(self) -> None:
+        """
+        Close pooled connections.
+
+        :return: None
+        """
+        await self.session.close()
+
+
+# loop attribute holding its transport, so the transport goes away with the loop instead of keeping it alive
+_TRANSPORT_ATTRIBUTE = '_wekan_transport'
+
+
+def get_transport() -> AsyncTransport:
+    """
+    Get transport shared by everything running in the current event loop.
+
+    Await `close` before the loop is closed to release pooled connections.
+
+    :return: transport
+    """
+    loop = asyncio.get_running_loop()
+    transport_ = getattr(loop, _TRANSPORT_ATTRIBUTE, None)
+    if transport_ is None:
+        transport_ = AsyncTransport(
+            base_url=config.WEKAN_BASE_URL,
+            pool_size=config.WEKAN_ASYNC_CONCURRENCY,
+            concurrency=config.WEKAN_ASYNC_CONCURRENCY,
+            retries=config.WEKAN_RETRIES,
+            backoff=config.WEKAN_BACKOFF,
+            timeout=config.WEKAN_TIMEOUT,
+        )
+        setattr(loop, _TRANSPORT_ATTRIBUTE, transport_)
+    return transport_
+
+
+async def close() -> None:
+    """
+    Close transport of the current event loop.
+
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    transport_ = getattr(loop, _TRANSPORT_ATTRIBUTE, None)
+    if transport_ is not None:
+        delattr(loop, _TRANSPORT_ATTRIBUTE)
+        await transport_.close()
+
+
+async def login(username: str,
+                password: str) -> InlineToken:
+    """
+    Authorization in Wekan service. Generates token.
+
+    :param username: username
+    :param password: password
+    :return: token with expiration date
+    """
+    headers = {
+        'Content-type': 'application/json',
+        'Accept': '*/*'
+    }
+    body = {
+        'username': username,
+        'password': password
+    }
+    route = "/users/login"
+    if store.mode == REPLAY:
+        # recorded responses need no authorization
+        return InlineToken(id=username, token='', tokenExpires=datetime.datetime.max.replace(tzinfo=datetime.timezone.utc))
+    logging.info(f"Get token from '{config.WEKAN_BASE_URL}'")
+    status, content = await get_transport().request('POST', route, json=body, headers=headers)
+    if status != 200:
+        raise LoginError(route, InlineApiError(**json.loads(content)))
+    return InlineToken(**json.loads(content))
+
+
+async def send_get(route: str,
+                   token: Union[str, InlineToken]) -> Any:
+    """
+    Simple request to the API. API docs said that there is no error.
+
+    :param route: requested route
+    :param token: token
+    :return: decoded response body
+    """
+    headers = {
+        'Authorization': f'Bearer {token.token if isinstance(token, (InlineToken,)) else token}',
+        'Content-type': 'application/json',
+    }
+    status, content = await _send_get(route, headers)
+    if status != 200:
+        raise RouteError(route, status)
+    if not content:
+        raise RouteError(route, 204)
+    return json.loads(content)
+
+
+async def _send_get(route: str,
+                    headers: Dict[str, str]) -> Tuple[int, bytes]:
+    if store.enabled:
+        stored = store.get(route)
+        if stored is not None:
+            return stored.status, stored.body
+        if store.mode == REPLAY:
+            logging.warning(f"Route '{route}' is not recorded")
+            return 404, b''
+
+    started = time.perf_counter()
+    try:
+        status, content = await get_transport().request('GET', route, headers=headers)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        metrics.observe_request(route, None, time.perf_counter() - started)
+        raise
+    metrics.observe_request(route, status, time.perf_counter() - started, len(content))
+    if store.enabled and store.records(route):
+        store.save(route, status, content)
+    return status, content
+
+
+async def get_boards_from_user(user: Union[str, InlineUser, User],
+                               token: Union[str, InlineToken]) -> List[InlineBoard]:
+    """
+    Get all boards from specified user.
+
+    :param user: user ID (as string) or User object
+    :param token: token
+    :return: list of boards IDs
+    """
+    user_id = user.id if isinstance(user, (InlineUser, User)) else user
+
+    data = await send_get(f'/api/users/{user_id}/boards', token)
+    return [InlineBoard(**i) for i in data]
+
+
+async def get_board(board: Union[str, InlineBoard],
+                    token: Union[str, InlineToken]) -> InlineBoard:
+    """
+    Get full board information.
+
+    :param board: board ID (as string) or Board object
+    :param token: token
+    :return: board info
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+
+    data = await send_get(f'/api/boards/{board_id}', token)
+    return InlineBoard(**data)
+
+
+async def get_all_lists(board: Union[str, InlineBoard],
+                        token: Union[str, InlineToken]) -> List[InlineList]:
+    """
+    Get all lists from specified board.
+
+    :param board: board ID (as string) or Board object
+    :param token: token
+    :return: list of Wekan lists IDs
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+
+    data = await send_get(f'/api/boards/{board_id}/lists', token)
+    return [InlineList(**i) for i in data]
+
+
+async def get_all_custom_fields(board: Union[str, InlineBoard],
+                                token: Union[str, InlineToken]) -> List[InlineCustomField]:
+    """
+    Get custom fields for specified board.
+
+    :param board: board ID (as string) or Board object
+    :param token: token
+    :return: list of custom fields
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+
+    data = await send_get(f'/api/boards/{board_id}/custom-fields', token)
+    return [InlineCustomField(**i) for i in data]
+
+
+async def get_all_cards(board: Union[str, InlineBoard],
+                        list_: Union[str, InlineList],
+                        token: Union[str, InlineToken]) -> List[InlineCard]:
+    """
+    Get all cards from list.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param token: token
+    :return: list of cards
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    list_id = list_.id if isinstance(list_, (InlineList,)) else list_
+
+    data = await send_get(f'/api/boards/{board_id}/lists/{list_id}/cards', token)
+    return [InlineCard(**i) for i in data]
+
+
+async def get_card(board: Union[str, InlineBoard],
+                   list_: Union[str, InlineList],
+                   card: Union[str, InlineCard, Card],
+                   token: Union[str, InlineToken]) -> Card:
+    """
+    Get full card info.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param card: card ID (as string) or Card object
+    :param token: token
+    :return: card info
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    list_id = list_.id if isinstance(list_, (InlineList,)) else list_
+    card_id = card.id if isinstance(card, (InlineCard, Card)) else card
+
+    data = await send_get(f'/api/boards/{board_id}/lists/{list_id}/cards/{card_id}', token)
+    return Card(**data)
+
+
+async def get_all_comments(board: Union[str, InlineBoard],
+                           card: Union[str, InlineCard, Card],
+                           token: Union[str, InlineToken]) -> List[InlineComment]:
+    """
+    Get all comments for the card.
+
+    :param board: board ID (as string) or Board object
+    :param card: card ID (as string) or Card object
+    :param token: token
+    :return: list of comments
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    card_id = card.id if isinstance(card, (InlineCard, Card)) else card
+
+    data = await send_get(f'/api/boards/{board_id}/cards/{card_id}/comments', token)
+    return [InlineComment(**i) for i in data]
+
+
+async def get_comment(board: Union[str, InlineBoard],
+                      card: Union[str, InlineCard, Card],
+                      comment: Union[str, InlineComment, Comment],
+                      token: Union[str, InlineToken]) -> Comment:
+    """
+    Get full comment info.
+
+    :param board: board ID (as string) or Board object
+    :param card: card ID (as string) or Card object
+    :param comment: comment ID (as string) or Comment object
+    :param token: token
+    :return: comment info
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    card_id = card.id if isinstance(card, (InlineCard, Card)) else card
+    comment_id = comment.id if isinstance(comment, (InlineComment, Comment)) else comment
+
+    data = await send_get(f'/api/boards/{board_id}/cards/{card_id}/comments/{comment_id}', token)
+    return Comment(**data)
+
+
+async def get_all_users(token: Union[str, InlineToken]) -> List[InlineUser]:
+    """
+    Get all users in service.
+
+    :param token: token
+    :return: list of users
+    """
+    data = await send_get(f'/api/users', token)
+    return [InlineUser(**i) for i in data]
+
+
+async def get_user(user: Union[str, InlineUser, User],
+                   token: Union[str, InlineToken]) -> User:
+    """
+    Get full user info.
+
+    :param user: user ID (as string) or User object
+    :param token: token
+    :return: user info
+    """
+    user_id = user.id if isinstance(user, (InlineUser, User)) else user
+
+    data = await send_get(f'/api/users/{user_id}', token)
+    return User(**data)
@@ -1,10 +1,25 @@
-from typing import Union
+import datetime
+from typing import Iterator, Union
 
 import requests
 import logging
+import time
 
 from ..config import config
+from ..metrics import metrics
+from . import decoding
 from .responses import *
+from .store import REPLAY, store
+from .transport import transport
+
+# collection functions return inline models, full ones need a request per item
+FULL_COLLECTIONS = False
+
+# comments of several cards are loaded with `get_cards_comments` in one call
+BULK_COMMENTS = False
+
+# size of body chunks handed to the streaming parser
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 class LoginError(Exception):
@@ -48,34 +63,92 @@ def login(username: str,
         'password': password
     }
     route = "/users/login"
+    if store.mode == REPLAY:
+        # recorded responses need no authorization
+        return InlineToken(id=username, token='', tokenExpires=datetime.datetime.max.replace(tzinfo=datetime.timezone.utc))
     logging.info(f"Get token from '{config.WEKAN_BASE_URL}'")
-    response = requests.post(f'{config.WEKAN_BASE_URL}{route}', json=body, headers=headers)
+    response = transport.request('POST', route, json=body, headers=headers)
     if response.status_code != 200:
         raise LoginError(route, InlineApiError(**response.json()))
     return InlineToken(**response.json())
 
 
 def send_get(route: str, 
-             token: Union[str, InlineToken]) -> requests.Response:
+             token: Union[str, InlineToken],
+             stream: bool = False) -> requests.Response:
     """
     Simple request to the API. API docs said that there is no error.
 
     :param route: requested route
     :param token: token
+    :param stream: do not download body yet, empty body is not checked then
     :return: raw response
     """
+    response = _send_get(route, token, stream)
+    if response.status_code != 200:
+        response.close()
+        raise RouteError(route, response.status_code)
+    if not stream and not response.content:
+        raise RouteError(route, 204)
+    return response
+
+
+def _send_get(route: str,
+              token: Union[str, InlineToken],
+              stream: bool) -> requests.Response:
+    # responses served from or saved to `store` are read in full
+    if store.enabled:
+        stored = store.get(route)
+        if stored is not None:
+            return stored.to_response()
+        if store.mode == REPLAY:
+            logging.warning(f"Route '{route}' is not recorded")
+            raise RouteError(route, 404)
+        if store.records(route):
+            stream = False
+
     headers = {
         'Authorization': f'Bearer {token.token if isinstance(token, (InlineToken,)) else token}',
         'Content-type': 'application/json',
     }
-    response = requests.get(f'{config.WEKAN_BASE_URL}{route}', headers=headers)
-    if response.status_code != 200:
-        raise RouteError(route, response.status_code)
-    if not response.content:
-        raise RouteError(route, 204)
+    started = time.perf_counter()
+    try:
+        response = transport.request('GET', route, headers=headers, stream=stream)
+    except requests.RequestException:
+        metrics.observe_request(route, None, time.perf_counter() - started)
+        raise
+    size = 0 if stream else len(response.content)
+    metrics.observe_request(route, response.status_code, time.perf_counter() - started, size)
+    if store.enabled and not stream and store.records(route):
+        store.save(route, response.status_code, response.content)
     return response
 
 
+def iter_body(route: str,
+              token: Union[str, InlineToken]) -> Iterator[bytes]:
+    """
+    Request to the API, yielding body chunks as they are downloaded.
+
+    :param route: requested route
+    :param token: token
+    :return: iterator of body chunks
+    """
+    with send_get(route, token, stream=True) as response:
+        size = 0
+        try:
+            chunks = (chunk for chunk in response.iter_content(STREAM_CHUNK_SIZE) if chunk)
+            first = next(chunks, None)
+            if first is None:
+                raise RouteError(route, 204)
+            size += len(first)
+            yield first
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            metrics.add_bytes(route, size)
+
+
 def get_boards_from_user(user: Union[str, InlineUser, User], 
                          token: Union[str, InlineToken]) -> List[InlineBoard]:
     """
@@ -88,7 +161,7 @@ def get_boards_from_user(user: Union[str, InlineUser, User],
     user_id = user.id if isinstance(user, (InlineUser, User)) else user
 
     response = send_get(f'/api/users/{user_id}/boards', token)
-    return [InlineBoard(**i) for i in response.json()]
+    return decoding.parse_list(InlineBoard, decoding.decode(response))
 
 
 def get_board(board: Union[str, InlineBoard], 
@@ -103,7 +176,7 @@ def get_board(board: Union[str, InlineBoard],
     board_id = board.id if isinstance(board, (InlineBoard,)) else board
 
     response = send_get(f'/api/boards/{board_id}', token)
-    return InlineBoard(**response.json())
+    return decoding.parse(InlineBoard, decoding.decode(response))
 
 
 def get_all_lists(board: Union[str, InlineBoard], 
@@ -118,7 +191,7 @@ def get_all_lists(board: Union[str, InlineBoard],
     board_id = board.id if isinstance(board, (InlineBoard,)) else board
 
     response = send_get(f'/api/boards/{board_id}/lists', token)
-    return [InlineList(**i) for i in response.json()]
+    return decoding.parse_list(InlineList, decoding.decode(response))
 
 
 def get_all_custom_fields(board: Union[str, InlineBoard], 
@@ -133,7 +206,7 @@ def get_all_custom_fields(board: Union[str, InlineBoard],
     board_id = board.id if isinstance(board, (InlineBoard,)) else board
 
     response = send_get(f'/api/boards/{board_id}/custom-fields', token)
-    return [InlineCustomField(**i) for i in response.json()]
+    return decoding.parse_list(InlineCustomField, decoding.decode(response))
 
 
 def get_all_cards(board: Union[str, InlineBoard], 
@@ -151,7 +224,43 @@ def get_all_cards(board: Union[str, InlineBoard],
     list_id = list_.id if isinstance(list_, (InlineList,)) else list_
 
     response = send_get(f'/api/boards/{board_id}/lists/{list_id}/cards', token)
-    return [InlineCard(**i) for i in response.json()]
+    return decoding.parse_list(InlineCard, decoding.decode(response))
+
+
+def iter_all_cards(board: Union[str, InlineBoard],
+                   list_: Union[str, InlineList],
+                   token: Union[str, InlineToken]) -> Iterator[InlineCard]:
+    """
+    Iterate over cards from list, parsing them while response is being downloaded.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param token: token
+    :return: iterator of cards
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    list_id = list_.id if isinstance(list_, (InlineList,)) else list_
+
+    body = iter_body(f'/api/boards/{board_id}/lists/{list_id}/cards', token)
+    return (decoding.parse(InlineCard, i) for i in decoding.iter_items(body))
+
+
+def get_all_card_ids(board: Union[str, InlineBoard],
+                     list_: Union[str, InlineList],
+                     token: Union[str, InlineToken]) -> List[str]:
+    """
+    Get IDs of all cards from list without building card objects.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param token: token
+    :return: list of card IDs
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    list_id = list_.id if isinstance(list_, (InlineList,)) else list_
+
+    body = iter_body(f'/api/boards/{board_id}/lists/{list_id}/cards', token)
+    return [i['_id'] for i in decoding.iter_items(body)]
 
 
 def get_card(board: Union[str, InlineBoard], 
@@ -172,7 +281,7 @@ def get_card(board: Union[str, InlineBoard],
     card_id = card.id if isinstance(card, (InlineCard, Card)) else card
 
     response = send_get(f'/api/boards/{board_id}/lists/{list_id}/cards/{card_id}', token)
-    return Card(**response.json())
+    return decoding.parse(Card, decoding.decode(response))
 
 
 def get_all_comments(board: Union[str, InlineBoard], 
@@ -190,7 +299,25 @@ def get_all_comments(board: Union[str, InlineBoard],
     card_id = card.id if isinstance(card, (InlineCard, Card)) else card
 
     response = send_get(f'/api/boards/{board_id}/cards/{card_id}/comments', token)
-    return [InlineComment(**i) for i in response.json()]
+    return decoding.parse_list(InlineComment, decoding.decode(response))
+
+
+def iter_all_comments(board: Union[str, InlineBoard],
+                      card: Union[str, InlineCard, Card],
+                      token: Union[str, InlineToken]) -> Iterator[InlineComment]:
+    """
+    Iterate over comments for the card, parsing them while response is being downloaded.
+
+    :param board: board ID (as string) or Board object
+    :param card: card ID (as string) or Card object
+    :param token: token
+    :return: iterator of comments
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    card_id = card.id if isinstance(card, (InlineCard, Card)) else card
+
+    body = iter_body(f'/api/boards/{board_id}/cards/{card_id}/comments', token)
+    return (decoding.parse(InlineComment, i) for i in decoding.iter_items(body))
 
 
 def get_comment(board: Union[str, InlineBoard], 
@@ -208,10 +335,10 @@ def get_comment(board: Union[str, InlineBoard],
     """
     board_id = board.id if isinstance(board, (InlineBoard,)) else board
     card_id = card.id if isinstance(card, (InlineCard, Card)) else card
-    comment_id = comment.id if isinstance(card, (InlineComment, Comment)) else comment
+    comment_id = comment.id if isinstance(comment, (InlineComment, Comment)) else comment
 
     response = send_get(f'/api/boards/{board_id}/cards/{card_id}/comments/{comment_id}', token)
-    return Comment(**response.json())
+    return decoding.parse(Comment, decoding.decode(response))
 
 
 def get_all_users(token: Union[str, InlineToken]) -> List[InlineUser]:
@@ -222,7 +349,29 @@ def get_all_users(token: Union[str, InlineToken]) -> List[InlineUser]:
     :return: list of users
     """
     response = send_get(f'/api/users', token)
-    return [InlineUser(**i) for i in response.json()]
+    return decoding.parse_list(InlineUser, decoding.decode(response))
+
+
+def iter_all_users(token: Union[str, InlineToken]) -> Iterator[InlineUser]:
+    """
+    Iterate over all users in service, parsing them while response is being downloaded.
+
+    :param token: token
+    :return: iterator of users
+    """
+    body = iter_body(f'/api/users', token)
+    return (decoding.parse(InlineUser, i) for i in decoding.iter_items(body))
+
+
+def get_all_user_ids(token: Union[str, InlineToken]) -> List[str]:
+    """
+    Get IDs of all users in service without building user objects.
+
+    :param token: token
+    :return: list of user IDs
+    """
+    body = iter_body(f'/api/users', token)
+    return [i['_id'] for i in decoding.iter_items(body)]
 
 
 def get_user(user: Union[str, InlineUser, User], 
@@ -237,4 +386,4 @@ def get_user(user: Union[str, InlineUser, User],
     user_id = user.id if isinstance(user, (InlineUser, User)) else user
 
     response = send_get(f'/api/users/{user_id}', token)
-    return User(**response.json())
+    return decoding.parse(User, decoding.decode(response))
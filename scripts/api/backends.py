@@ -0,0 +1,10 @@
+from ..config import config
+from . import api, wekan_db
+
+# modules with the same route functions, selected by `config.WEKAN_SOURCE`
+BACKENDS = {
+    'rest': api,
+    'mongo': wekan_db,
+}
+
+backend = BACKENDS[config.WEKAN_SOURCE]
@@ -0,0 +1,155 @@
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type, TypeVar
+
+import requests
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
+
+from ..config import config
+from .responses import Comment, InlineCard, InlineComment, InlineUser, User, UserEmail
+
+try:
+    import orjson
+    loads: Callable[[bytes], Any] = orjson.loads
+except ImportError:
+    loads = json.loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+Model = TypeVar('Model', bound=BaseModel)
+
+# values already of these field types pass validation unchanged
+_EXACT_TYPES = (str, int, float, bool)
+
+# fields the adapter never reads, trusted decoding takes them as is; subclasses inherit the entries
+UNREAD_FIELDS: Dict[Type[BaseModel], Tuple[str, ...]] = {
+    InlineCard: ('description',),
+    InlineComment: ('author_id',),
+    Comment: ('user_id',),
+    InlineUser: ('username',),
+    User: ('username', 'created_at', 'profile'),
+    UserEmail: ('verified',),
+}
+
+
+def decode(response: requests.Response) -> Any:
+    """
+    Decode JSON body with the fastest available parser.
+
+    :param response: raw response
+    :return: decoded body
+    """
+    return loads(response.content)
+
+
+def iter_items(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Decode items of JSON array body one by one while its chunks arrive.
+
+    Without `ijson` installed the whole body is joined and decoded at once.
+
+    :param chunks: body chunks
+    :return: iterator of decoded items
+    """
+    if ijson is None:
+        yield from loads(b''.join(chunks))
+        return
+    items = ijson.sendable_list()
+    parser = ijson.items_coro(items, 'item', use_float=True)
+    for chunk in chunks:
+        parser.send(chunk)
+        yield from items
+        del items[:]
+    parser.close()
+    yield from items
+
+
+def _get_unread_fields(model: Type[BaseModel]) -> Set[str]:
+    return {name for base in model.__mro__ for name in UNREAD_FIELDS.get(base, ())}
+
+
+# for each model field: name, alias, required flag, default, converter of a raw value,
+# field to validate it with and the type whose values need no validation
+@lru_cache(maxsize=None)
+def _plan(model: Type[BaseModel]) -> Tuple[Tuple[str, str, bool, Any, Callable[[Any], Any],
+                                                 Optional[ModelField], Optional[type]], ...]:
+    unread = _get_unread_fields(model)
+    plan = []
+    for name, field in model.__fields__.items():
+        converter = None
+        validated = None
+        exact = None
+        if isinstance(field.type_, type) and issubclass(field.type_, BaseModel) \
+                and field.shape in (SHAPE_SINGLETON, SHAPE_LIST):
+            nested = field.type_
+            if field.shape == SHAPE_SINGLETON:
+                converter = lambda value, nested=nested: construct(nested, value)
+            else:
+                converter = lambda value, nested=nested: [construct(nested, i) for i in value]
+        elif name not in unread:
+            validated = field
+            if field.shape == SHAPE_SINGLETON and field.outer_type_ in _EXACT_TYPES:
+                exact = field.outer_type_
+        plan.append((name, field.alias, field.required, field.default, converter, validated, exact))
+    return tuple(plan)
+
+
+def construct(model: Type[Model], data: Dict[str, Any]) -> Model:
+    """
+    Build model from trusted API data, validating only fields the adapter reads.
+
+    Read fields are coerced as in normal validation, nested models are built the same way,
+    and fields listed in `UNREAD_FIELDS` are taken as is. A missing required field or an invalid
+    read one falls back to normal validation, so its error is raised.
+
+    :param model: model class
+    :param data: decoded JSON object
+    :return: model
+    """
+    values = {}
+    for name, alias, required, default, converter, field, exact in _plan(model):
+        if alias in data:
+            value = data[alias]
+        elif name in data:
+            value = data[name]
+        elif required:
+            return model(**data)
+        else:
+            values[name] = default
+            continue
+        if field is not None and (exact is None or type(value) is not exact):
+            value, errors = field.validate(value, values, loc=name, cls=model)
+            if errors:
+                return model(**data)
+        elif converter is not None and value is not None:
+            value = converter(value)
+        values[name] = value
+    return model.construct(**values)
+
+
+def parse(model: Type[Model], data: Dict[str, Any]) -> Model:
+    """
+    Build model, skipping validation if `config.WEKAN_TRUSTED_DECODING` is set.
+
+    :param model: model class
+    :param data: decoded JSON object
+    :return: model
+    """
+    if config.WEKAN_TRUSTED_DECODING:
+        return construct(model, data)
+    return model(**data)
+
+
+def parse_list(model: Type[Model], data: List[Dict[str, Any]]) -> List[Model]:
+    """
+    Build list of models, see `parse`.
+
+    :param model: model class
+    :param data: decoded JSON array
+    :return: list of models
+    """
+    return [parse(model, i) for i in data]
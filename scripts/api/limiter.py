@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+class TokenBucket:
+    """Request rate limit allowing bursts of `burst` requests"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Take one token, waiting for it if bucket is empty. Rate of 0 disables the limit.
+
+        :return: None
+        """
+        wait = self.try_acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+    def try_acquire(self) -> float:
+        """
+        Take one token if there is one.
+
+        :return: 0 if token is taken, otherwise seconds until the next one
+        """
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: grows by one per `limit` healthy responses, halves on
+    429/5xx, connection errors or latency above `latency_tolerance` times the usual one
+    """
+
+    def __init__(self,
+                 minimum: int = 1,
+                 maximum: int = 32,
+                 latency_tolerance: float = 3.0,
+                 decrease: float = 0.5):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.latency_tolerance = latency_tolerance
+        self.decrease = decrease
+        self.limit = float(self.maximum)
+        self.latency: Optional[float] = None
+        self._inflight = 0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+        # futures of coroutines waiting in `acquire_async`, with event loops they belong to
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def acquire(self) -> None:
+        """
+        Wait until number of requests in flight is below the current limit.
+
+        :return: None
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._inflight < int(self.limit))
+            self._inflight += 1
+
+    async def acquire_async(self) -> None:
+        """
+        Wait until number of requests in flight is below the current limit without blocking the event loop.
+
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._inflight < int(self.limit):
+                    self._inflight += 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self._condition:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+
+    def try_acquire(self) -> bool:
+        """
+        Take a request slot if number of requests in flight is below the current limit.
+
+        :return: True if slot is taken
+        """
+        with self._condition:
+            if self._inflight >= int(self.limit):
+                return False
+            self._inflight += 1
+            return True
+
+    def release(self,
+                latency: float,
+                status: Optional[int]) -> None:
+        """
+        Finish request and adjust limit by its outcome.
+
+        :param latency: request duration in seconds
+        :param status: response status code, None on connection error
+        :return: None
+        """
+        with self._condition:
+            self._inflight -= 1
+            overloaded = status is None or status == 429 or status >= 500
+            slow = self.latency is not None and latency > self.latency * self.latency_tolerance
+            if overloaded or slow:
+                now = time.monotonic()
+                # requests sent before the previous decrease report the same congestion
+                if now - self._decreased_at > (self.latency or latency):
+                    self._decreased_at = now
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    logging.debug(f"Concurrency limit decreased to {int(self.limit)}")
+            else:
+                self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._notify()
+
+    def cancel(self) -> None:
+        """
+        Free request slot of a request that was not sent, leaving the limit as is.
+
+        :return: None
+        """
+        with self._condition:
+            self._inflight -= 1
+            self._notify()
+
+    def _notify(self) -> None:
+        # called with the lock held, every waiter checks the limit again
+        self._condition.notify_all()
+        for loop, waiter in self._waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # loop is closed, its coroutine is gone
+                pass
+        self._waiters.clear()
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Limiter:
+    """Rate limit and adaptive concurrency applied to every API request, shared by threads and event loops"""
+
+    def __init__(self,
+                 rate: float = 0,
+                 burst: int = 1,
+                 min_concurrency: int = 1,
+                 max_concurrency: int = 32,
+                 latency_tolerance: float = 3.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveLimiter(min_concurrency, max_concurrency, latency_tolerance)
+
+    def acquire(self) -> None:
+        """
+        Wait for a request slot.
+
+        :return: None
+        """
+        self.concurrency.acquire()
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self.concurrency.cancel()
+            raise
+
+    async def acquire_async(self) -> None:
+        """
+        Wait for a request slot without blocking the event loop.
+
+        :return: None
+        """
+        await self.concurrency.acquire_async()
+        try:
+            wait = self.bucket.try_acquire()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self.bucket.try_acquire()
+        except BaseException:
+            # e.g. cancelled, the slot would otherwise be lost for good
+            self.concurrency.cancel()
+            raise
+
+    def release(self,
+                latency: float,
+                status: Optional[int]) -> None:
+        """
+        Free request slot.
+
+        :param latency: request duration in seconds
+        :param status: response status code, None on connection error
+        :return: None
+        """
+        self.concurrency.release(latency, status)
@@ -0,0 +1,203 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+
+import requests
+from pydantic import BaseModel
+
+from ..config import config
+from ..metrics import route_template
+
+OFF = 'off'
+RECORD = 'record'
+REPLAY = 'replay'
+MODES = (OFF, RECORD, REPLAY)
+
+
+def parse_ttls(value: str) -> Dict[str, float]:
+    """
+    Parse per-route TTLs like `/api/boards/{id}/lists=600,/api/users/{id}=86400`.
+
+    :param value: comma-separated `route=seconds` pairs, routes with `{id}` in place of IDs
+    :return: TTL in seconds for each route template
+    """
+    ttls = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        route, _, seconds = item.rpartition('=')
+        if not route:
+            raise ValueError(f"Expected 'route=seconds', got '{item}'")
+        ttls[route.strip()] = float(seconds)
+    return ttls
+
+
+class StoredResponse(BaseModel):
+    route: str
+    status: int
+    body: bytes
+    stored_at: float
+
+    def to_response(self) -> requests.Response:
+        """
+        Build response object as if it came from the network.
+
+        :return: response with body already read
+        """
+        response = requests.Response()
+        response.status_code = self.status
+        response._content = self.body
+        response._content_consumed = True
+        response.url = self.route
+        return response
+
+
+class ResponseStore:
+    """
+    Responses of GET routes kept in an SQLite file with zlib-compressed bodies, committed every `batch_size` saves
+    and on `flush` or `close`.
+
+    In `record` mode every successful response is saved, in `replay` mode responses are served only from the store.
+    Routes listed in `ttls` are saved in any mode and served from the store while younger than their TTL.
+    """
+
+    def __init__(self,
+                 path: str,
+                 mode: str = OFF,
+                 ttls: Optional[Dict[str, float]] = None,
+                 batch_size: int = 100):
+        if mode not in MODES:
+            raise ValueError(f"Unknown store mode '{mode}', expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.ttls = ttls or {}
+        self.batch_size = batch_size
+        self._pending = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != OFF or bool(self.ttls)
+
+    def _connect(self) -> sqlite3.Connection:
+        # worker processes open their own connection
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(route TEXT PRIMARY KEY, status INTEGER NOT NULL, body BLOB NOT NULL, stored_at REAL NOT NULL)'
+            )
+            self._pid = os.getpid()
+            self._pending = 0
+        return self._connection
+
+    def load(self, route: str) -> Optional[StoredResponse]:
+        """
+        Read stored response regardless of its age.
+
+        :param route: requested route
+        :return: stored response or None
+        """
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT status, body, stored_at FROM responses WHERE route = ?', (route,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, body, stored_at = row
+        return StoredResponse(route=route, status=status, body=zlib.decompress(body), stored_at=stored_at)
+
+    def save(self,
+             route: str,
+             status: int,
+             body: bytes) -> None:
+        """
+        Save successful response, replacing the previous one of the route. Errors are not saved.
+
+        :param route: requested route
+        :param status: response status code
+        :param body: response body
+        :return: None
+        """
+        if not 200 <= status < 300:
+            return
+        compressed = zlib.compress(body)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO responses (route, status, body, stored_at) VALUES (?, ?, ?, ?)',
+                (route, status, compressed, time.time()),
+            )
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._commit()
+
+    def flush(self) -> None:
+        """
+        Commit saved responses.
+
+        :return: None
+        """
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._commit()
+
+    def _commit(self) -> None:
+        if self._pending:
+            self._connection.commit()
+            self._pending = 0
+
+    def get(self, route: str) -> Optional[StoredResponse]:
+        """
+        Get response to serve instead of sending request.
+
+        :param route: requested route
+        :return: stored response, None if request has to be sent
+        """
+        if self.mode == REPLAY:
+            return self.load(route)
+        ttl = self.ttls.get(route_template(route))
+        if ttl is None:
+            return None
+        stored = self.load(route)
+        if stored is not None and stored.status == 200 and time.time() - stored.stored_at < ttl:
+            logging.debug(f"Route '{route}' served from store")
+            return stored
+        return None
+
+    def records(self, route: str) -> bool:
+        """
+        Check if response of the route has to be saved.
+
+        :param route: requested route
+        :return: True in `record` mode or for routes with TTL
+        """
+        return self.mode == RECORD or (self.mode != REPLAY and route_template(route) in self.ttls)
+
+    def close(self) -> None:
+        """
+        Commit saved responses and close database file.
+
+        :return: None
+        """
+        with self._lock:
+            if self._connection is not None:
+                if self._pid == os.getpid():
+                    self._commit()
+                self._connection.close()
+                self._connection = None
+
+
+store = ResponseStore(
+    path=config.WEKAN_STORE_PATH,
+    mode=config.WEKAN_STORE_MODE,
+    ttls=parse_ttls(config.WEKAN_CACHE_TTLS),
+    batch_size=config.WEKAN_STORE_BATCH_SIZE,
+)
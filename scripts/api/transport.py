@@ -0,0 +1,136 @@
+import time
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..config import config
+from .limiter import Limiter
+
+
+def get_retry_delay(attempt: int,
+                    backoff: float,
+                    retry_after: Optional[str] = None) -> float:
+    """
+    Get pause before the next attempt: exponential backoff, or `Retry-After` seconds if the server asked for more.
+
+    :param attempt: number of the failed attempt, from 0
+    :param backoff: backoff factor in seconds
+    :param retry_after: value of `Retry-After` header
+    :return: seconds to wait
+    """
+    delay = backoff * 2 ** attempt
+    if retry_after is not None:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+class Transport:
+    """
+    Shared HTTP session with keep-alive pooling, retries and timeouts.
+
+    Every attempt, retries included, passes the limiter, so 429/5xx answers reach its adaptive limit.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self,
+                 base_url: str,
+                 pool_size: int = 10,
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 timeout: Optional[float] = 30,
+                 limiter: Optional[Limiter] = None):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = limiter or Limiter()
+        self.session = self._make_session()
+
+    def _make_session(self) -> requests.Session:
+        # retries are sent by `request` through the limiter
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(total=0, raise_on_status=False),
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def request(self,
+                method: str,
+                route: str,
+                **kwargs: Any) -> requests.Response:
+        """
+        Send request to the API through the pooled session once limiter allows it,
+        retrying 429/5xx answers and connection errors.
+
+        :param method: HTTP method
+        :param route: requested route
+        :param kwargs: extra arguments for `requests.Session.request`
+        :return: raw response, the last one if all attempts failed
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            retry_after = None
+            self.limiter.acquire()
+            started = time.monotonic()
+            status = None
+            try:
+                response = self.session.request(method, f'{self.base_url}{route}', **kwargs)
+                status = response.status_code
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            finally:
+                self.limiter.release(time.monotonic() - started, status)
+
+            if status is not None:
+                if status not in self.RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+            time.sleep(get_retry_delay(attempt, self.backoff, retry_after))
+            attempt += 1
+
+    def reset(self) -> None:
+        """
+        Drop pooled connections and start a new session.
+
+        :return: None
+        """
+        self.session.close()
+        self.session = self._make_session()
+
+    def close(self) -> None:
+        """
+        Close pooled connections.
+
+        :return: None
+        """
+        self.session.close()
+
+
+transport = Transport(
+    base_url=config.WEKAN_BASE_URL,
+    pool_size=config.WEKAN_POOL_SIZE,
+    retries=config.WEKAN_RETRIES,
+    backoff=config.WEKAN_BACKOFF,
+    timeout=config.WEKAN_TIMEOUT,
+    limiter=Limiter(
+        rate=config.WEKAN_RATE_LIMIT,
+        burst=config.WEKAN_RATE_BURST,
+        min_concurrency=config.WEKAN_MIN_CONCURRENCY,
+        max_concurrency=config.WEKAN_MAX_CONCURRENCY,
+        latency_tolerance=config.WEKAN_LATENCY_TOLERANCE,
+    ),
+)
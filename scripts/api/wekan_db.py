@@ -0,0 +1,366 @@
+import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Union
+
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from ..config import config
+from .api import RouteError
+from .responses import *
+
+CARD_FIELDS = (
+    '_id', 'title', 'description', 'assignees', 'receivedAt', 'startAt', 'endAt', 'dueAt',
+    'createdAt', 'dateLastActivity', 'boardId', 'listId', 'spentTime', 'customFields',
+)
+USER_FIELDS = ('_id', 'username', 'createdAt', 'profile.fullname', 'emails')
+
+# collection functions return full `Card` and `User` models
+FULL_COLLECTIONS = True
+
+# comments of several cards are loaded with `get_cards_comments` in one call
+BULK_COMMENTS = True
+
+_client = None
+
+
+def get_database() -> Database:
+    """
+    Get Wekan database, connecting on first use.
+
+    :return: database
+    """
+    global _client
+    if _client is None:
+        _client = MongoClient(config.WEKAN_MONGO_URI, tz_aware=True)
+    return _client.get_default_database()
+
+
+def reset() -> None:
+    """
+    Drop connection, next call reconnects.
+
+    :return: None
+    """
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def _projection(fields: tuple) -> Dict[str, int]:
+    return {field: 1 for field in fields}
+
+
+def _find_one(collection: str,
+              query: Dict[str, Any],
+              route: str,
+              fields: tuple = ()) -> Dict[str, Any]:
+    document = get_database()[collection].find_one(query, _projection(fields) if fields else None)
+    if document is None:
+        raise RouteError(route, 204)
+    return document
+
+
+def _map_comments(comments: Iterator[Dict[str, Any]]) -> Iterator[InlineComment]:
+    return (InlineComment(_id=i['_id'], comment=i.get('text', ''), authorId=i.get('userId', '')) for i in comments)
+
+
+def login(username: str,
+          password: str) -> InlineToken:
+    """
+    Stub for REST authorization, database access needs no token.
+
+    :param username: username
+    :param password: password
+    :return: token which never expires
+    """
+    return InlineToken(id=username, token='', tokenExpires=datetime.datetime.max.replace(tzinfo=datetime.timezone.utc))
+
+
+def get_boards_from_user(user: Union[str, InlineUser, User],
+                         token: Union[str, InlineToken]) -> List[InlineBoard]:
+    """
+    Get all boards from specified user.
+
+    :param user: user ID (as string) or User object
+    :param token: token
+    :return: list of boards IDs
+    """
+    user_id = user.id if isinstance(user, (InlineUser, User)) else user
+
+    boards = get_database().boards.find(
+        {'members.userId': user_id, 'archived': False, 'type': {'$ne': 'template-container'}},
+        _projection(('_id', 'title')),
+    )
+    return [InlineBoard(**i) for i in boards]
+
+
+def get_board(board: Union[str, InlineBoard],
+              token: Union[str, InlineToken]) -> InlineBoard:
+    """
+    Get full board information.
+
+    :param board: board ID (as string) or Board object
+    :param token: token
+    :return: board info
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+
+    return InlineBoard(**_find_one('boards', {'_id': board_id}, f'boards/{board_id}', ('_id', 'title')))
+
+
+def get_all_lists(board: Union[str, InlineBoard],
+                  token: Union[str, InlineToken]) -> List[InlineList]:
+    """
+    Get all lists from specified board.
+
+    :param board: board ID (as string) or Board object
+    :param token: token
+    :return: list of Wekan lists IDs
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+
+    lists = get_database().lists.find({'boardId': board_id, 'archived': False}, _projection(('_id', 'title')))
+    return [InlineList(**i) for i in lists]
+
+
+def get_all_custom_fields(board: Union[str, InlineBoard],
+                          token: Union[str, InlineToken]) -> List[InlineCustomField]:
+    """
+    Get custom fields for specified board.
+
+    :param board: board ID (as string) or Board object
+    :param token: token
+    :return: list of custom fields
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+
+    fields = get_database().customFields.find({'boardIds': board_id}, _projection(('_id', 'name', 'type')))
+    return [InlineCustomField(**i) for i in fields]
+
+
+def get_all_cards(board: Union[str, InlineBoard],
+                  list_: Union[str, InlineList],
+                  token: Union[str, InlineToken]) -> List[Card]:
+    """
+    Get all cards from list with full info in one query.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param token: token
+    :return: list of cards
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    list_id = list_.id if isinstance(list_, (InlineList,)) else list_
+
+    cards = get_database().cards.find(
+        {'boardId': board_id, 'listId': list_id, 'archived': False},
+        _projection(CARD_FIELDS),
+    ).sort('sort', 1)
+    return [Card(**i) for i in cards]
+
+
+def iter_all_cards(board: Union[str, InlineBoard],
+                   list_: Union[str, InlineList],
+                   token: Union[str, InlineToken]) -> Iterator[Card]:
+    """
+    Iterate over cards from list with full info, reading them from cursor in batches.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param token: token
+    :return: iterator of cards
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    list_id = list_.id if isinstance(list_, (InlineList,)) else list_
+
+    cards = get_database().cards.find(
+        {'boardId': board_id, 'listId': list_id, 'archived': False},
+        _projection(CARD_FIELDS),
+    ).sort('sort', 1)
+    return (Card(**i) for i in cards)
+
+
+def get_all_card_ids(board: Union[str, InlineBoard],
+                     list_: Union[str, InlineList],
+                     token: Union[str, InlineToken]) -> List[str]:
+    """
+    Get IDs of all cards from list.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param token: token
+    :return: list of card IDs
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    list_id = list_.id if isinstance(list_, (InlineList,)) else list_
+
+    cards = get_database().cards.find(
+        {'boardId': board_id, 'listId': list_id, 'archived': False},
+        _projection(('_id',)),
+    ).sort('sort', 1)
+    return [i['_id'] for i in cards]
+
+
+def get_card(board: Union[str, InlineBoard],
+             list_: Union[str, InlineList],
+             card: Union[str, InlineCard, Card],
+             token: Union[str, InlineToken]) -> Card:
+    """
+    Get full card info.
+
+    :param board: board ID (as string) or Board object
+    :param list_: list ID (as string) or List object
+    :param card: card ID (as string) or Card object
+    :param token: token
+    :return: card info
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    list_id = list_.id if isinstance(list_, (InlineList,)) else list_
+    card_id = card.id if isinstance(card, (InlineCard, Card)) else card
+
+    return Card(**_find_one(
+        'cards',
+        {'_id': card_id, 'boardId': board_id, 'listId': list_id},
+        f'cards/{card_id}',
+        CARD_FIELDS,
+    ))
+
+
+def get_all_comments(board: Union[str, InlineBoard],
+                     card: Union[str, InlineCard, Card],
+                     token: Union[str, InlineToken]) -> List[InlineComment]:
+    """
+    Get all comments for the card.
+
+    :param board: board ID (as string) or Board object
+    :param card: card ID (as string) or Card object
+    :param token: token
+    :return: list of comments
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    card_id = card.id if isinstance(card, (InlineCard, Card)) else card
+
+    comments = get_database().card_comments.find(
+        {'boardId': board_id, 'cardId': card_id},
+        _projection(('_id', 'text', 'userId')),
+    ).sort('createdAt', 1)
+    return list(_map_comments(comments))
+
+
+def iter_all_comments(board: Union[str, InlineBoard],
+                      card: Union[str, InlineCard, Card],
+                      token: Union[str, InlineToken]) -> Iterator[InlineComment]:
+    """
+    Iterate over comments for the card, reading them from cursor in batches.
+
+    :param board: board ID (as string) or Board object
+    :param card: card ID (as string) or Card object
+    :param token: token
+    :return: iterator of comments
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    card_id = card.id if isinstance(card, (InlineCard, Card)) else card
+
+    comments = get_database().card_comments.find(
+        {'boardId': board_id, 'cardId': card_id},
+        _projection(('_id', 'text', 'userId')),
+    ).sort('createdAt', 1)
+    return _map_comments(comments)
+
+
+def get_cards_comments(board: Union[str, InlineBoard],
+                       cards: Iterable[Union[str, InlineCard, Card]],
+                       token: Union[str, InlineToken]) -> Dict[str, List[InlineComment]]:
+    """
+    Get comments of several cards of the board in one query.
+
+    :param board: board ID (as string) or Board object
+    :param cards: card IDs (as string) or Card objects
+    :param token: token
+    :return: comments of each card in creation order, empty list for cards without comments
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    card_ids = [card.id if isinstance(card, (InlineCard, Card)) else card for card in cards]
+
+    result: Dict[str, List[InlineComment]] = {card_id: [] for card_id in card_ids}
+    if not card_ids:
+        return result
+    comments = get_database().card_comments.find(
+        {'boardId': board_id, 'cardId': {'$in': card_ids}},
+        _projection(('_id', 'text', 'userId', 'cardId')),
+    ).sort('createdAt', 1)
+    for i in comments:
+        result[i['cardId']].append(
+            InlineComment(_id=i['_id'], comment=i.get('text', ''), authorId=i.get('userId', ''))
+        )
+    return result
+
+
+def get_comment(board: Union[str, InlineBoard],
+                card: Union[str, InlineCard, Card],
+                comment: Union[str, InlineComment, Comment],
+                token: Union[str, InlineToken]) -> Comment:
+    """
+    Get full comment info.
+
+    :param board: board ID (as string) or Board object
+    :param card: card ID (as string) or Card object
+    :param comment: comment ID (as string) or Comment object
+    :param token: token
+    :return: comment info
+    """
+    board_id = board.id if isinstance(board, (InlineBoard,)) else board
+    card_id = card.id if isinstance(card, (InlineCard, Card)) else card
+    comment_id = comment.id if isinstance(comment, (InlineComment, Comment)) else comment
+
+    return Comment(**_find_one(
+        'card_comments',
+        {'_id': comment_id, 'boardId': board_id, 'cardId': card_id},
+        f'card_comments/{comment_id}',
+        ('_id', 'boardId', 'cardId', 'createdAt', 'userId'),
+    ))
+
+
+def get_all_users(token: Union[str, InlineToken]) -> List[User]:
+    """
+    Get all users in service with full info in one query.
+
+    :param token: token
+    :return: list of users
+    """
+    return [User(**i) for i in get_database().users.find({}, _projection(USER_FIELDS))]
+
+
+def iter_all_users(token: Union[str, InlineToken]) -> Iterator[User]:
+    """
+    Iterate over all users in service with full info, reading them from cursor in batches.
+
+    :param token: token
+    :return: iterator of users
+    """
+    return (User(**i) for i in get_database().users.find({}, _projection(USER_FIELDS)))
+
+
+def get_all_user_ids(token: Union[str, InlineToken]) -> List[str]:
+    """
+    Get IDs of all users in service.
+
+    :param token: token
+    :return: list of user IDs
+    """
+    return [i['_id'] for i in get_database().users.find({}, _projection(('_id',)))]
+
+
+def get_user(user: Union[str, InlineUser, User],
+             token: Union[str, InlineToken]) -> User:
+    """
+    Get full user info.
+
+    :param user: user ID (as string) or User object
+    :param token: token
+    :return: user info
+    """
+    user_id = user.id if isinstance(user, (InlineUser, User)) else user
+
+    return User(**_find_one('users', {'_id': user_id}, f'users/{user_id}', USER_FIELDS))
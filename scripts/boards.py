@@ -0,0 +1,119 @@
+import datetime
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Union
+
+from scripts import api, database
+from scripts.config import config
+
+COMPLETE_FIELD_NAME = "Выполнено"
+
+
+def find_complete_field_id(custom_fields: List[api.InlineCustomField]) -> Union[str, None]:
+    """
+    Find completion field among board custom fields.
+
+    :param custom_fields: board custom fields
+    :return: complete field id
+    """
+    for field in custom_fields:
+        if field.name == COMPLETE_FIELD_NAME:
+            return field.id
+    return None
+
+
+class BoardMetadata(NamedTuple):
+    """Board lists and completion field, needed to map every card of the board"""
+    lists: List[api.InlineList]
+    complete_field_id: Optional[str]
+    loaded_at: datetime.datetime
+
+    @property
+    def lists_by_id(self) -> Dict[str, api.InlineList]:
+        return {list_.id: list_ for list_ in self.lists}
+
+
+class BoardMetadataCache:
+    """
+    Board metadata kept in memory and in `database.BoardInfo` for `ttl` seconds,
+    so boards do not cost lists and custom fields requests on every run
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = datetime.timedelta(seconds=config.BOARD_METADATA_TTL if ttl is None else ttl)
+        self._boards: Dict[str, BoardMetadata] = {}
+        self._lock = threading.Lock()
+
+    def get(self,
+            board: Union[str, api.InlineBoard],
+            token: Union[str, api.InlineToken],
+            refresh: bool = False) -> BoardMetadata:
+        """
+        Get board metadata, loading it from Wekan if it is missing, expired or `refresh` is set.
+
+        :param board: board ID (as string) or Board object
+        :param token: token
+        :param refresh: ignore cached metadata
+        :return: board metadata
+        """
+        board_id = board.id if isinstance(board, (api.InlineBoard,)) else board
+        now = datetime.datetime.utcnow()
+
+        if not refresh and self.ttl:
+            with self._lock:
+                metadata = self._boards.get(board_id)
+            if metadata is None:
+                metadata = self._load(board_id)
+            if metadata is not None and now - metadata.loaded_at < self.ttl:
+                with self._lock:
+                    self._boards[board_id] = metadata
+                return metadata
+
+        metadata = BoardMetadata(
+            lists=api.backend.get_all_lists(board, token),
+            complete_field_id=find_complete_field_id(api.backend.get_all_custom_fields(board, token)),
+            loaded_at=now,
+        )
+        if self.ttl:
+            self._save(board_id, metadata)
+            with self._lock:
+                self._boards[board_id] = metadata
+        return metadata
+
+    def invalidate(self, board_id: str) -> None:
+        """
+        Drop cached metadata of the board.
+
+        :param board_id: board ID
+        :return: None
+        """
+        with self._lock:
+            self._boards.pop(board_id, None)
+        database.BoardInfo.objects(board_id=board_id).delete()
+
+    @staticmethod
+    def _load(board_id: str) -> Optional[BoardMetadata]:
+        info = database.BoardInfo.objects(board_id=board_id).as_pymongo().first()
+        if info is None:
+            return None
+        return BoardMetadata(
+            lists=[api.InlineList(_id=i['id'], title=i['title']) for i in info.get('lists', [])],
+            complete_field_id=info.get('complete_field_id'),
+            loaded_at=info['loaded_at'].replace(tzinfo=None),
+        )
+
+    @staticmethod
+    def _save(board_id: str, metadata: BoardMetadata) -> None:
+        try:
+            database.BoardInfo.objects(board_id=board_id).update_one(
+                set__lists=[{'id': list_.id, 'title': list_.title} for list_ in metadata.lists],
+                set__complete_field_id=metadata.complete_field_id,
+                set__loaded_at=metadata.loaded_at,
+                upsert=True,
+            )
+        except Exception as e:
+            # cache is only an optimization, the board is synced with fresh metadata anyway
+            logging.warning(f"Metadata of board '{board_id}' not cached: {e}")
+
+
+board_metadata = BoardMetadataCache()
@@ -0,0 +1,180 @@
+import datetime
+import logging
+import threading
+import uuid
+from typing import Iterable, List, Optional
+
+import requests
+from pymongo.errors import ConnectionFailure
+
+from scripts import api, database
+from scripts.config import config
+
+
+# errors of an unavailable Wekan or database, a run failing with them is left unfinished to be resumed
+OUTAGE_ERRORS = (requests.RequestException, ConnectionFailure)
+
+
+def is_outage(error: BaseException) -> bool:
+    """
+    Check if sync failed because Wekan or database is unavailable rather than because of the board.
+
+    :param error: raised error
+    :return: True for connection errors, timeouts, 429 and 5xx answers
+    """
+    if isinstance(error, api.RouteError):
+        return error.status is None or error.status == 429 or error.status >= 500
+    return isinstance(error, OUTAGE_ERRORS)
+
+
+class BoardProgress:
+    """Lists of one board whose cards are saved, recorded in `database.SyncCheckpoint` if `persist` is set"""
+
+    def __init__(self,
+                 board_id: str,
+                 completed: Iterable[str] = (),
+                 persist: bool = True,
+                 name: Optional[str] = None):
+        self.board_id = board_id
+        self.name = config.SYNC_RUN_NAME if name is None else name
+        self.completed = set(completed)
+        self.persist = persist
+        self._lock = threading.Lock()
+
+    def pending(self, lists: Iterable[api.InlineList]) -> List[api.InlineList]:
+        """
+        Filter out lists completed before the sync was interrupted.
+
+        :param lists: lists of the board
+        :return: lists left to sync
+        """
+        return [list_ for list_ in lists if list_.id not in self.completed]
+
+    def complete(self, list_id: str) -> None:
+        """
+        Record list as completed, all its cards must be saved by now.
+
+        :param list_id: list ID
+        :return: None
+        """
+        with self._lock:
+            if list_id in self.completed:
+                return
+            self.completed.add(list_id)
+        if self.persist:
+            database.SyncCheckpoint.objects(name=self.name, board_id=self.board_id).update_one(
+                add_to_set__lists=list_id
+            )
+
+    def finish(self) -> None:
+        """
+        Record board as synced in the current run.
+
+        :return: None
+        """
+        if self.persist:
+            database.SyncCheckpoint.objects(name=self.name, board_id=self.board_id).update_one(
+                set__finished_at=datetime.datetime.utcnow()
+            )
+
+
+class SyncCheckpoints:
+    """
+    Progress of the sync of all boards kept in `database.SyncRun` and `database.SyncCheckpoint`,
+    so a run interrupted less than `ttl` seconds ago is resumed from the last completed list of each board.
+
+    A run is resumed every time it is interrupted, until it was started `max_attempts` times in total;
+    the next attempt starts from scratch, so a run which can never finish does not stay stale forever.
+    """
+
+    def __init__(self,
+                 name: Optional[str] = None,
+                 ttl: Optional[float] = None,
+                 enabled: Optional[bool] = None,
+                 max_attempts: Optional[int] = None):
+        self.name = config.SYNC_RUN_NAME if name is None else name
+        self.ttl = datetime.timedelta(seconds=config.CHECKPOINT_TTL if ttl is None else ttl)
+        self.enabled = config.SYNC_CHECKPOINTS if enabled is None else enabled
+        self.max_attempts = config.CHECKPOINT_MAX_ATTEMPTS if max_attempts is None else max_attempts
+
+    def begin(self) -> bool:
+        """
+        Start sync run, or continue the interrupted one if it is younger than `ttl`
+        and was attempted less than `max_attempts` times.
+
+        :return: True if interrupted run is resumed
+        """
+        if not self.enabled:
+            return False
+        now = datetime.datetime.utcnow()
+        run = self._load_run()
+        if run is not None and run.get('finished_at') is None:
+            started_at = run['started_at'].replace(tzinfo=None)
+            attempts = run.get('attempts', 0)
+            if now - started_at < self.ttl and attempts < self.max_attempts:
+                database.SyncRun.objects(name=self.name).update_one(inc__attempts=1)
+                logging.info(f"Resuming sync run '{self.name}' started at {started_at}, attempt {attempts + 1}")
+                return True
+        database.SyncRun.objects(name=self.name).update_one(
+            set__run_id=uuid.uuid4().hex,
+            set__started_at=now,
+            set__attempts=1,
+            unset__finished_at=True,
+            upsert=True,
+        )
+        return False
+
+    def end(self) -> None:
+        """
+        Mark sync run as finished, the next one starts every board from scratch.
+
+        :return: None
+        """
+        if self.enabled:
+            database.SyncRun.objects(name=self.name).update_one(set__finished_at=datetime.datetime.utcnow())
+
+    def reset(self, board_ids: Iterable[str]) -> None:
+        """
+        Drop progress of failed boards, a resumed run syncs them from scratch while the others continue.
+
+        :param board_ids: board IDs
+        :return: None
+        """
+        board_ids = list(board_ids)
+        if self.enabled and board_ids:
+            database.SyncCheckpoint.objects(name=self.name, board_id__in=board_ids).delete()
+
+    def board(self, board_id: str) -> Optional[BoardProgress]:
+        """
+        Get progress of the board in the current run, starting a new checkpoint if the board was not synced yet.
+
+        :param board_id: board ID
+        :return: board progress, None if the board is already synced in this run
+        """
+        run = self._load_run() if self.enabled else None
+        if run is None or run.get('finished_at') is not None:
+            # outside of a run, e.g. a single board refresh, progress is not worth saving
+            return BoardProgress(board_id, persist=False, name=self.name)
+
+        checkpoint = database.SyncCheckpoint.objects(name=self.name, board_id=board_id).as_pymongo().first()
+        if checkpoint is not None and checkpoint.get('run_id') == run.get('run_id'):
+            if checkpoint.get('finished_at') is not None:
+                return None
+            if checkpoint.get('lists'):
+                logging.info(f"Board '{board_id}' resumed after {len(checkpoint['lists'])} completed list(s)")
+            return BoardProgress(board_id, checkpoint.get('lists', []), name=self.name)
+
+        database.SyncCheckpoint.objects(name=self.name, board_id=board_id).update_one(
+            set__run_id=run.get('run_id'),
+            set__started_at=datetime.datetime.utcnow(),
+            set__lists=[],
+            unset__finished_at=True,
+            upsert=True,
+        )
+        return BoardProgress(board_id, name=self.name)
+
+    def _load_run(self) -> Optional[dict]:
+        return database.SyncRun.objects(name=self.name).as_pymongo().first()
+
+
+checkpoints = SyncCheckpoints()
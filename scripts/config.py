@@ -1,7 +1,10 @@
 import os
+from typing import Literal, Optional
 
 from dotenv import dotenv_values
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator
+from pymongo import uri_parser
+from pymongo.errors import ConfigurationError
 
 from scripts.utils import singleton
 
@@ -12,12 +15,89 @@ class Config(BaseModel):
     WEKAN_PASSWORD: str
     WEKAN_ADMIN_USER: str
     WEKAN_BASE_URL: str
+    WEKAN_SOURCE: Literal['rest', 'mongo'] = 'rest'
+    WEKAN_MONGO_URI: Optional[str] = None
+    WEKAN_POOL_SIZE: int = 16
+    WEKAN_RETRIES: int = 3
+    WEKAN_BACKOFF: float = 0.5
+    WEKAN_TIMEOUT: float = 30
+    WEKAN_RATE_LIMIT: float = 0
+    WEKAN_RATE_BURST: int = 10
+    WEKAN_MIN_CONCURRENCY: int = 1
+    WEKAN_MAX_CONCURRENCY: int = 16
+    WEKAN_LATENCY_TOLERANCE: float = 3
+    WEKAN_TRUSTED_DECODING: bool = False
+    WEKAN_CARD_WORKERS: int = 8
+    WEKAN_ASYNC_CONCURRENCY: int = 64
+    WEKAN_USER_WORKERS: int = 8
+    WEKAN_STORE_MODE: str = 'off'
+    WEKAN_STORE_PATH: str = 'responses.sqlite3'
+    WEKAN_STORE_BATCH_SIZE: int = 100
+    WEKAN_CACHE_TTLS: str = ''
+
+    BOARD_METADATA_TTL: int = 600
+
+    SYNC_INTERVAL: int = 300
+    TOKEN_REFRESH_MARGIN: int = 60 * 60
+
+    WEBHOOK_HOST: str = '127.0.0.1'
+    WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_DEBOUNCE: float = 1
+    WEBHOOK_RECONCILE_INTERVAL: int = 60 * 60
+
+    SYNC_PROCESSES: int = 1
+    SYNC_LEASES: bool = False
+    LEASE_TTL: int = 120
+    LEASE_WINDOW: Optional[int] = None
+    SYNC_CHECKPOINTS: bool = False
+    SYNC_RUN_NAME: str = 'default'
+    CHECKPOINT_TTL: int = 24 * 60 * 60
+    CHECKPOINT_MAX_ATTEMPTS: int = 5
+
+    SYNC_SCHEDULE: bool = False
+    SCHEDULE_MIN_INTERVAL: Optional[int] = None
+    SCHEDULE_MAX_STALENESS: int = 24 * 60 * 60
+    SCHEDULE_TARGET_CHANGES: float = 5
+    SCHEDULE_SMOOTHING: float = 0.5
+
+    SYNC_PIPELINE: bool = False
+    PIPELINE_QUEUE_SIZE: int = 100
+    PIPELINE_SCAN_WORKERS: int = 1
+    PIPELINE_FETCH_WORKERS: int = 8
+    PIPELINE_MAP_WORKERS: int = 8
+    PIPELINE_USER_WORKERS: int = 1
+
+    USERS_SNAPSHOT_PATH: Optional[str] = None
+    USERS_SNAPSHOT_TTL: int = 24 * 60 * 60
+
+    METRICS_PATH: Optional[str] = None
+    METRICS_SUMMARY_PATH: Optional[str] = None
+    METRICS_HOST: str = '127.0.0.1'
+    METRICS_PORT: Optional[int] = None
 
     MONGO_USER: str
     MONGO_PASSWORD: str
     MONGO_HOST: str
     MONGO_PORT: int
     MONGO_DB: str
+    MONGO_BATCH_SIZE: int = 500
+
+    @root_validator(skip_on_failure=True)
+    def check_wekan_mongo_uri(cls, values):
+        """Wekan database is read from `WEKAN_MONGO_URI`, which must name it"""
+        if values['WEKAN_SOURCE'] != 'mongo':
+            return values
+        uri = values['WEKAN_MONGO_URI']
+        if not uri:
+            raise ValueError("WEKAN_MONGO_URI must be set when WEKAN_SOURCE is 'mongo'")
+        try:
+            database = uri_parser.parse_uri(uri)['database']
+        except ConfigurationError as e:
+            raise ValueError(f"Invalid WEKAN_MONGO_URI: {e}")
+        if not database:
+            raise ValueError("WEKAN_MONGO_URI must include the Wekan database name, e.g. mongodb://host:27017/wekan")
+        return values
 
 
 config = Config(
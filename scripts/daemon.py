@@ -0,0 +1,100 @@
+import datetime
+import logging
+import signal
+import threading
+import time
+from typing import Optional
+
+from scripts import adapter, api, sync
+from scripts.config import config
+from scripts.metrics import metrics
+from scripts.users import UserDirectory
+
+
+class Daemon:
+    """Runs sync cycles on interval, keeping token, connections and caches between them"""
+
+    def __init__(self,
+                 interval: Optional[float] = None,
+                 token_margin: Optional[float] = None):
+        self.interval = config.SYNC_INTERVAL if interval is None else interval
+        self.token_margin = datetime.timedelta(
+            seconds=config.TOKEN_REFRESH_MARGIN if token_margin is None else token_margin
+        )
+        self.token: Optional[api.InlineToken] = None
+        self.users: Optional[UserDirectory] = None
+        self.users_loaded_at = 0.0
+        self.stopped = threading.Event()
+        self._lock = threading.RLock()
+
+    def get_token(self) -> api.InlineToken:
+        """
+        Get token, logging in again only when it is close to expiration.
+
+        :return: token
+        """
+        with self._lock:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            if self.token is not None:
+                expires = self.token.token_expires
+                if expires.tzinfo is None:
+                    expires = expires.replace(tzinfo=datetime.timezone.utc)
+                if expires - now > self.token_margin:
+                    return self.token
+            with metrics.stage('login'):
+                self.token = api.backend.login(config.WEKAN_USERNAME, config.WEKAN_PASSWORD)
+            return self.token
+
+    def get_users(self) -> UserDirectory:
+        """
+        Get user directory, reloading it every `config.USERS_SNAPSHOT_TTL` seconds.
+
+        :return: user directory
+        """
+        with self._lock:
+            if self.users is None or time.monotonic() - self.users_loaded_at > config.USERS_SNAPSHOT_TTL:
+                self.users = adapter.get_user_directory(self.get_token())
+                self.users_loaded_at = time.monotonic()
+            return self.users
+
+    def run_once(self) -> None:
+        """
+        Run one sync cycle and export metrics. Errors are logged; after a 401 or 403 answer
+        the token is dropped, so the next cycle logs in again.
+
+        :return: None
+        """
+        try:
+            stats = sync.sync_boards(self.get_token(), self.get_users())
+            logging.info(f"'{stats.matched + stats.upserted}' cards were added or updated, "
+                         f"'{stats.skipped}' unchanged cards were not written")
+        except api.RouteError as e:
+            logging.exception(e)
+            if e.status in (401, 403):
+                self.token = None
+        except Exception as e:
+            logging.exception(e)
+        metrics.export(config.METRICS_PATH, config.METRICS_SUMMARY_PATH)
+
+    def run(self) -> None:
+        """
+        Run sync cycles until SIGINT or SIGTERM, finishing the current cycle first.
+
+        :return: None
+        """
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        logging.info(f"Daemon started with {self.interval}s interval")
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            self.run_once()
+            self.stopped.wait(max(self.interval - (time.monotonic() - started), 0))
+        logging.info(f"Daemon stopped")
+
+    def stop(self, *args) -> None:
+        """
+        Ask daemon to stop after the current cycle.
+
+        :return: None
+        """
+        self.stopped.set()
@@ -1,3 +1,96 @@
 from footprint_mongoengine import connect, disconnect
 from footprint_mongoengine.models.user import User
 from footprint_mongoengine.models.wekan import Card, CardInfo, StatusEnum
+from mongoengine import DateTimeField, DictField, Document, FloatField, IntField, ListField, StringField
+
+
+class CardComment(Document):
+    """Wekan card comment already seen by adapter"""
+    board_id = StringField(required=True)
+    card_id = StringField(required=True)
+    comment_id = StringField(required=True, unique_with=('board_id', 'card_id'))
+    completed_at = DateTimeField()
+
+    meta = {
+        'collection': 'wekan_adapter_comments',
+        'indexes': [('board_id', 'card_id')],
+    }
+
+
+class BoardLease(Document):
+    """Claim of a board by one adapter instance"""
+    board_id = StringField(required=True, unique=True)
+    owner = StringField(required=True)
+    expires_at = DateTimeField(required=True)
+    heartbeat_at = DateTimeField()
+    synced_at = DateTimeField()
+
+    meta = {
+        'collection': 'wekan_adapter_leases',
+    }
+
+
+class CardFingerprint(Document):
+    """Hash of card fields last saved by adapter"""
+    board_id = StringField(required=True)
+    card_id = StringField(required=True, unique_with='board_id')
+    fingerprint = StringField(required=True)
+
+    meta = {
+        'collection': 'wekan_adapter_fingerprints',
+    }
+
+
+class BoardInfo(Document):
+    """Lists and completion field of a board cached by adapter"""
+    board_id = StringField(required=True, unique=True)
+    lists = ListField(DictField())
+    complete_field_id = StringField()
+    loaded_at = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'wekan_adapter_boards',
+    }
+
+
+class SyncRun(Document):
+    """Start and end of the last sync of all boards, unfinished if it was interrupted"""
+    name = StringField(required=True, unique=True)
+    # new for every run started from scratch, checkpoints of other runs are stale
+    run_id = StringField()
+    started_at = DateTimeField(required=True)
+    finished_at = DateTimeField()
+    # times the run was started or resumed
+    attempts = IntField(default=0)
+
+    meta = {
+        'collection': 'wekan_adapter_runs',
+    }
+
+
+class SyncCheckpoint(Document):
+    """Lists of a board whose cards are saved by the current sync run"""
+    name = StringField(required=True)
+    board_id = StringField(required=True, unique_with='name')
+    run_id = StringField()
+    started_at = DateTimeField(required=True)
+    finished_at = DateTimeField()
+    lists = ListField(StringField())
+
+    meta = {
+        'collection': 'wekan_adapter_checkpoints',
+    }
+
+
+class BoardSchedule(Document):
+    """Observed card update rate of a board and time of its next sync"""
+    board_id = StringField(required=True, unique=True)
+    rate = FloatField(default=0)
+    synced_at = DateTimeField()
+    next_sync_at = DateTimeField()
+    changed_at = DateTimeField()
+    last_activity = DateTimeField()
+
+    meta = {
+        'collection': 'wekan_adapter_schedule',
+    }
@@ -0,0 +1,112 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from mongoengine import NotUniqueError, Q
+
+from scripts import database
+from scripts.config import config
+
+
+class BoardLeases:
+    """Board claims shared by adapter instances through `database.BoardLease` documents"""
+
+    def __init__(self,
+                 owner: Optional[str] = None,
+                 ttl: Optional[float] = None,
+                 window: Optional[float] = None):
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.ttl = datetime.timedelta(seconds=config.LEASE_TTL if ttl is None else ttl)
+        if window is None:
+            window = config.LEASE_WINDOW if config.LEASE_WINDOW is not None else 0.8 * config.SYNC_INTERVAL
+        self.window = datetime.timedelta(seconds=window)
+
+    def claim(self, board_id: str) -> bool:
+        """
+        Claim board if its lease expired and nobody synced it within the window.
+
+        :param board_id: board ID
+        :return: True if board is claimed by this instance
+        """
+        now = datetime.datetime.utcnow()
+        try:
+            lease = database.BoardLease.objects(
+                Q(board_id=board_id) &
+                (Q(expires_at__lte=now) | Q(owner=self.owner)) &
+                (Q(synced_at=None) | Q(synced_at__lte=now - self.window))
+            ).modify(
+                upsert=True,
+                new=True,
+                set_on_insert__board_id=board_id,
+                set__owner=self.owner,
+                set__expires_at=now + self.ttl,
+                set__heartbeat_at=now,
+            )
+        except NotUniqueError:
+            return False
+        return lease is not None
+
+    def renew(self, board_id: str) -> bool:
+        """
+        Extend lease held by this instance.
+
+        :param board_id: board ID
+        :return: False if lease was lost
+        """
+        now = datetime.datetime.utcnow()
+        return bool(database.BoardLease.objects(board_id=board_id, owner=self.owner).update_one(
+            set__expires_at=now + self.ttl,
+            set__heartbeat_at=now,
+        ))
+
+    def release(self, board_id: str, synced: bool) -> None:
+        """
+        Release lease, marking board as synced on success.
+
+        :param board_id: board ID
+        :param synced: whether sync finished
+        :return: None
+        """
+        now = datetime.datetime.utcnow()
+        update = {'set__expires_at': now}
+        if synced:
+            update['set__synced_at'] = now
+        database.BoardLease.objects(board_id=board_id, owner=self.owner).update_one(**update)
+
+    @contextmanager
+    def hold(self, board_id: str) -> Iterator[bool]:
+        """
+        Claim board and renew its lease in background until the block exits.
+
+        :param board_id: board ID
+        :return: context yielding True if board is claimed
+        """
+        if not self.claim(board_id):
+            yield False
+            return
+
+        stopped = threading.Event()
+
+        def heartbeat() -> None:
+            while not stopped.wait(self.ttl.total_seconds() / 3):
+                if not self.renew(board_id):
+                    logging.warning(f"Lease of board '{board_id}' lost by '{self.owner}'")
+                    return
+
+        thread = threading.Thread(target=heartbeat, name=f'lease-{board_id}', daemon=True)
+        thread.start()
+        synced = False
+        try:
+            yield True
+            synced = True
+        finally:
+            stopped.set()
+            thread.join()
+            self.release(board_id, synced)
+
+
+leases = BoardLeases()
@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# upper bounds of latency buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# objects with `stage_entered(name)` and `stage_exited(name)` called by the thread running the stage,
+# see `scripts.profiler`
+stage_listeners: List[Any] = []
+
+
+def route_template(route: str) -> str:
+    """
+    Replace IDs in API route with `{id}`, so metrics are kept per route, not per object.
+
+    :param route: requested route, e.g. `/api/boards/abc/lists`
+    :return: route template, e.g. `/api/boards/{id}/lists`
+    """
+    parts = route.split('?', 1)[0].split('/')
+    if len(parts) > 1 and parts[1] == 'api':
+        # /api/<collection>/<id>/<collection>/<id>...
+        for index in range(3, len(parts), 2):
+            parts[index] = '{id}'
+    return '/'.join(parts)
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum and maximum"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Add value.
+
+        :param value: observed value
+        :return: None
+        """
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'Histogram') -> None:
+        """
+        Add values of another histogram with the same buckets.
+
+        :param other: histogram
+        :return: None
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'seconds': round(self.sum, 6),
+            'mean_seconds': round(self.sum / self.count, 6) if self.count else 0,
+            'max_seconds': round(self.max, 6),
+        }
+
+
+class Metrics:
+    """Request, stage and board counters of the process, exported as Prometheus text or JSON summary"""
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self.bytes: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[str, Histogram] = defaultdict(Histogram)
+        self.boards: Dict[str, Dict[str, int]] = defaultdict(lambda: {'scanned': 0, 'updated': 0})
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['boards'] = dict(state['boards'])
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        boards = self.boards
+        self.boards = defaultdict(lambda: {'scanned': 0, 'updated': 0})
+        self.boards.update(boards)
+        self._lock = threading.Lock()
+
+    def observe_request(self,
+                        route: str,
+                        status: Optional[int],
+                        latency: float,
+                        size: int = 0) -> None:
+        """
+        Record API request.
+
+        :param route: requested route
+        :param status: response status code, None on connection error
+        :param latency: seconds until response headers
+        :param size: bytes of response body
+        :return: None
+        """
+        route = route_template(route)
+        with self._lock:
+            self.requests[(route, 'error' if status is None else str(status))] += 1
+            self.latency[route].observe(latency)
+            self.bytes[route] += size
+
+    def add_bytes(self,
+                  route: str,
+                  size: int) -> None:
+        """
+        Record bytes of response body read after the request was recorded.
+
+        :param route: requested route
+        :param size: bytes of response body
+        :return: None
+        """
+        with self._lock:
+            self.bytes[route_template(route)] += size
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the enclosed block as a run of stage `name`.
+
+        :param name: stage name
+        :return: context manager
+        """
+        for listener in stage_listeners:
+            listener.stage_entered(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stages[name].observe(elapsed)
+            for listener in stage_listeners:
+                listener.stage_exited(name)
+
+    def count_cards(self,
+                    board_id: str,
+                    scanned: int = 0,
+                    updated: int = 0) -> None:
+        """
+        Record cards of the board compared with database and found updated.
+
+        :param board_id: board ID
+        :param scanned: number of scanned cards
+        :param updated: number of updated cards
+        :return: None
+        """
+        with self._lock:
+            self.boards[board_id]['scanned'] += scanned
+            self.boards[board_id]['updated'] += updated
+
+    def merge(self, other: 'Metrics') -> None:
+        """
+        Add metrics collected elsewhere, e.g. in a worker process.
+
+        :param other: metrics
+        :return: None
+        """
+        with self._lock:
+            for key, value in other.requests.items():
+                self.requests[key] += value
+            for key, value in other.latency.items():
+                self.latency[key].merge(value)
+            for key, value in other.bytes.items():
+                self.bytes[key] += value
+            for key, value in other.stages.items():
+                self.stages[key].merge(value)
+            for key, value in other.boards.items():
+                self.boards[key]['scanned'] += value['scanned']
+                self.boards[key]['updated'] += value['updated']
+
+    def pop(self) -> 'Metrics':
+        """
+        Take collected metrics, starting from zero.
+
+        :return: metrics collected so far
+        """
+        popped = Metrics()
+        with self._lock:
+            for name in ('requests', 'latency', 'bytes', 'stages', 'boards', 'started'):
+                value = getattr(self, name)
+                setattr(self, name, getattr(popped, name))
+                setattr(popped, name, value)
+            self.started = time.time()
+        return popped
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Build JSON-serializable summary.
+
+        :return: summary of requests per route, stages and boards
+        """
+        with self._lock:
+            requests = {}
+            for route, histogram in sorted(self.latency.items()):
+                requests[route] = dict(
+                    histogram.summary(),
+                    bytes=self.bytes.get(route, 0),
+                    statuses={status: count for (name, status), count in sorted(self.requests.items()) if name == route},
+                )
+            return {
+                'started_at': self.started,
+                'duration_seconds': round(time.time() - self.started, 3),
+                'requests': requests,
+                'stages': {name: histogram.summary() for name, histogram in sorted(self.stages.items())},
+                'boards': {board_id: dict(cards) for board_id, cards in sorted(self.boards.items())},
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Render metrics in Prometheus text exposition format.
+
+        :return: metrics text
+        """
+        lines: List[str] = []
+        with self._lock:
+            lines += _header('wekan_requests_total', 'counter', 'Wekan API requests by route and status')
+            for (route, status), count in sorted(self.requests.items()):
+                lines.append(f'wekan_requests_total{_labels(route=route, status=status)} {count}')
+            lines += _header('wekan_response_bytes_total', 'counter', 'Bytes of Wekan API response bodies')
+            for route, size in sorted(self.bytes.items()):
+                lines.append(f'wekan_response_bytes_total{_labels(route=route)} {size}')
+            lines += _header('wekan_request_duration_seconds', 'histogram', 'Wekan API request latency')
+            for route, histogram in sorted(self.latency.items()):
+                lines += _histogram('wekan_request_duration_seconds', histogram, route=route)
+            lines += _header('wekan_stage_duration_seconds', 'histogram', 'Time spent in sync stages')
+            for name, histogram in sorted(self.stages.items()):
+                lines += _histogram('wekan_stage_duration_seconds', histogram, stage=name)
+            lines += _header('wekan_board_cards_scanned_total', 'counter', 'Cards compared with database')
+            for board_id, cards in sorted(self.boards.items()):
+                lines.append(f'wekan_board_cards_scanned_total{_labels(board=board_id)} {cards["scanned"]}')
+            lines += _header('wekan_board_cards_updated_total', 'counter', 'Cards found updated')
+            for board_id, cards in sorted(self.boards.items()):
+                lines.append(f'wekan_board_cards_updated_total{_labels(board=board_id)} {cards["updated"]}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self,
+               prometheus_path: Optional[str] = None,
+               summary_path: Optional[str] = None) -> None:
+        """
+        Write Prometheus text and JSON summary to files, each only if its path is given.
+
+        :param prometheus_path: path of Prometheus text file
+        :param summary_path: path of JSON summary file
+        :return: None
+        """
+        if prometheus_path:
+            _write(prometheus_path, self.to_prometheus())
+        if summary_path:
+            _write(summary_path, json.dumps(self.summary(), indent=2, ensure_ascii=False))
+
+
+def _header(name: str, kind: str, help_: str) -> List[str]:
+    return [f'# HELP {name} {help_}', f'# TYPE {name} {kind}']
+
+
+def _labels(**labels: Any) -> str:
+    escaped = (
+        f'{key}="' + re.sub(r'(["\\])', r'\\\1', str(value)).replace('\n', '\\n') + '"'
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _histogram(name: str, histogram: Histogram, **labels: Any) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram.sum}')
+    lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
+    return lines
+
+
+def _write(path: str, text: str) -> None:
+    # replace atomically, so a scraper never reads a half-written file
+    temp = f'{path}.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves `/metrics` in Prometheus text format and `/summary` as JSON"""
+
+    server: 'MetricsServer'
+
+    def do_GET(self) -> None:
+        if self.path == '/metrics':
+            body = self.server.metrics.to_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/summary':
+            body = json.dumps(self.server.metrics.summary(), ensure_ascii=False).encode()
+            content_type = 'application/json'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"Metrics {self.address_string()}: {format % args}")
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], metrics: Metrics):
+        super().__init__(address, MetricsHandler)
+        self.metrics = metrics
+
+    def start(self) -> None:
+        """
+        Serve metrics in a background thread.
+
+        :return: None
+        """
+        threading.Thread(target=self.serve_forever, name='metrics-server', daemon=True).start()
+        logging.info(f"Metrics served on {self.server_address[0]}:{self.server_address[1]}")
+
+
+metrics = Metrics()
@@ -0,0 +1,96 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+# marks the end of a stage input
+_DONE = object()
+
+
+class Pipeline:
+    """Stages connected by bounded queues, each stage served by its own worker threads"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.error: Optional[BaseException] = None
+        self._stages: List[Tuple[str, Callable[[Any], Optional[Iterable[Any]]], int]] = []
+        self._lock = threading.Lock()
+
+    def add_stage(self,
+                  name: str,
+                  func: Callable[[Any], Optional[Iterable[Any]]],
+                  workers: int = 1) -> 'Pipeline':
+        """
+        Append stage. Every item emitted by `func` goes to the next stage.
+
+        :param name: stage name
+        :param func: function returning iterable of output items (or None) for an input item
+        :param workers: number of threads serving the stage
+        :return: the same pipeline
+        """
+        self._stages.append((name, func, max(workers, 1)))
+        return self
+
+    def run(self, items: Iterable[Any]) -> None:
+        """
+        Push items through all stages and wait until the last one is done.
+
+        The first exception raised by any stage stops processing and is re-raised here.
+
+        :param items: input of the first stage
+        :return: None
+        """
+        queues = [queue.Queue(self.queue_size) for _ in self._stages]
+        threads = []
+        for index, (name, func, workers) in enumerate(self._stages):
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            remaining = [workers]
+            for number in range(workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(func, inbox, outbox, remaining),
+                    name=f'{name}-{number}',
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        for item in items:
+            if self.error is not None:
+                break
+            queues[0].put(item)
+        queues[0].put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _work(self,
+              func: Callable[[Any], Optional[Iterable[Any]]],
+              inbox: queue.Queue,
+              outbox: Optional[queue.Queue],
+              remaining: List[int]) -> None:
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                # let sibling workers see the end too
+                inbox.put(_DONE)
+                break
+            if self.error is not None:
+                # keep draining so upstream stages never block on a full queue
+                continue
+            try:
+                for result in func(item) or ():
+                    if outbox is not None:
+                        outbox.put(result)
+            except Exception as e:
+                with self._lock:
+                    if self.error is None:
+                        self.error = e
+
+        with self._lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and outbox is not None:
+            outbox.put(_DONE)
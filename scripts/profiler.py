@@ -0,0 +1,447 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from scripts import metrics as metrics_module
+
+# stage of threads outside any `metrics.stage` block, only the main thread is profiled there
+MAIN_STAGE = 'main'
+
+HTTP = 'http'
+MONGO = 'mongo'
+WAIT = 'wait'
+CPU = 'cpu'
+CATEGORIES = (HTTP, MONGO, WAIT, CPU)
+
+# the outermost frame from one of these packages decides where time goes
+_PACKAGE_CATEGORIES = {
+    'requests': HTTP,
+    'urllib3': HTTP,
+    'http': HTTP,
+    'aiohttp': HTTP,
+    'pymongo': MONGO,
+    'mongoengine': MONGO,
+    'footprint_mongoengine': MONGO,
+    'bson': MONGO,
+    'mongomock': MONGO,
+}
+# leaf frames of threads waiting for other threads
+_WAIT_MODULES = ('threading.py', 'queue.py')
+
+
+def classify_file(filename: str) -> Optional[str]:
+    """
+    Find where code of the file spends time: in HTTP client or Mongo driver packages.
+
+    :param filename: code file name
+    :return: HTTP, MONGO or None for other code
+    """
+    for part in filename.replace('\\', '/').split('/')[:-1]:
+        category = _PACKAGE_CATEGORIES.get(part)
+        if category is not None:
+            return category
+    return None
+
+
+class StageClock:
+    """Time of stages in `metrics.stages` since `start`, and time of the whole profile for the main stage"""
+
+    def __init__(self, metrics: Optional[metrics_module.Metrics] = None):
+        self.metrics = metrics_module.metrics if metrics is None else metrics
+        self._sums: Dict[str, float] = {}
+        self._started: Optional[float] = None
+        self._stopped: Optional[float] = None
+
+    def start(self) -> None:
+        """
+        Remember time already spent in stages, it is left out of the profile.
+
+        :return: None
+        """
+        self._sums = self._read()
+        self._started = time.perf_counter()
+        self._stopped = None
+
+    def stop(self) -> None:
+        """
+        Stop the time of the main stage.
+
+        :return: None
+        """
+        self._stopped = time.perf_counter()
+
+    def seconds(self, stage: str) -> float:
+        """
+        Get time spent in stage blocks since profiling started, summed over threads running the stage.
+
+        :param stage: stage name
+        :return: seconds
+        """
+        if stage == MAIN_STAGE:
+            if self._started is None:
+                return 0.0
+            return (time.perf_counter() if self._stopped is None else self._stopped) - self._started
+        return self._read().get(stage, 0.0) - self._sums.get(stage, 0.0)
+
+    def _read(self) -> Dict[str, float]:
+        return {name: histogram.sum for name, histogram in list(self.metrics.stages.items())}
+
+
+def _label(code: Any, module: str) -> str:
+    # `;` separates frames in collapsed stacks
+    return f'{module}.{code.co_name}'.replace(';', ':')
+
+
+class SamplingProfiler:
+    """
+    Samples stacks of threads running a `metrics.stage` block every `interval` seconds from a background thread.
+
+    Each sample is weighted by the time measured since the previous one, so late wake-ups of the sampler
+    are not undercounted. Samples are kept per innermost stage as collapsed stacks, so every stage
+    gets its own flame graph.
+    """
+
+    mode = 'sampling'
+
+    def __init__(self,
+                 interval: float = 0.005,
+                 max_depth: int = 128,
+                 metrics: Optional[metrics_module.Metrics] = None):
+        self.interval = interval
+        self.max_depth = max_depth
+        # thread-seconds per stack and per category of each stage
+        self.stacks: Dict[Tuple[str, Tuple[str, ...]], float] = defaultdict(float)
+        self.categories: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.clock = StageClock(metrics)
+        # stages entered by each thread, innermost last, changed by the threads and read by the sampler
+        self._stages: Dict[int, List[str]] = {}
+        self._stages_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._main = threading.main_thread().ident
+
+    def stage_entered(self, name: str) -> None:
+        with self._stages_lock:
+            self._stages.setdefault(threading.get_ident(), []).append(name)
+
+    def stage_exited(self, name: str) -> None:
+        with self._stages_lock:
+            stages = self._stages.get(threading.get_ident())
+            if stages:
+                stages.pop()
+
+    def start(self) -> None:
+        """
+        Start sampling and listening to stages.
+
+        :return: None
+        """
+        self.clock.start()
+        metrics_module.stage_listeners.append(self)
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop sampling.
+
+        :return: None
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        metrics_module.stage_listeners.remove(self)
+        self.clock.stop()
+
+    def _run(self) -> None:
+        try:
+            self._sample()
+        except Exception as e:
+            logging.exception(f"Sampling profiler stopped, later stages are not sampled: {e}")
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        previous = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            weight = now - previous
+            previous = now
+            with self._stages_lock:
+                current = {ident: stages[-1] for ident, stages in self._stages.items() if stages}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident in current:
+                    stage = current[ident]
+                elif ident == self._main:
+                    stage = MAIN_STAGE
+                else:
+                    continue
+                stack, category = self._walk(frame)
+                self.stacks[(stage, stack)] += weight
+                self.categories[(stage, category)] += weight
+
+    def _walk(self, frame: Any) -> Tuple[Tuple[str, ...], str]:
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()
+
+        category = None
+        for item in frames:
+            category = classify_file(item.f_code.co_filename)
+            if category is not None:
+                break
+        if category is None:
+            category = WAIT if frames and frames[-1].f_code.co_filename.endswith(_WAIT_MODULES) else CPU
+        stack = tuple(_label(item.f_code, item.f_globals.get('__name__', '?')) for item in frames)
+        return stack, category
+
+    def _iter_stage_stacks(self, stage: str) -> Iterator[Tuple[Tuple[str, ...], float]]:
+        for (name, stack), seconds in self.stacks.items():
+            if name == stage:
+                yield stack, seconds
+
+    def summary(self, top: int = 20) -> Dict[str, Any]:
+        """
+        Summarize samples per stage: wall time, thread-seconds by category and the hottest functions.
+
+        :param top: number of functions to list per stage
+        :return: JSON-serializable summary
+        """
+        stages = sorted({stage for stage, _ in self.stacks})
+        result = {}
+        for stage in stages:
+            own: Dict[str, float] = defaultdict(float)
+            total: Dict[str, float] = defaultdict(float)
+            for stack, seconds in self._iter_stage_stacks(stage):
+                if stack:
+                    own[stack[-1]] += seconds
+                for label in set(stack):
+                    total[label] += seconds
+            categories = {category: self.categories.get((stage, category), 0.0) for category in CATEGORIES}
+            result[stage] = {
+                'wall_seconds': round(self.clock.seconds(stage), 3),
+                'thread_seconds': round(sum(categories.values()), 3),
+                'categories': {category: round(value, 3) for category, value in categories.items()},
+                'top_self': _top(own, top),
+                'top_total': _top(total, top),
+            }
+        return {'mode': self.mode, 'interval': self.interval, 'stages': result}
+
+    def write(self,
+              directory: str,
+              top: int = 20) -> Dict[str, Any]:
+        """
+        Write collapsed stacks per stage (`<stage>.folded`, `all.folded` rooted at stages) weighted
+        in microseconds for flamegraph.pl or speedscope, and the summary as `summary.json` and `summary.txt`.
+
+        :param directory: output directory, created if missing
+        :param top: number of functions to list per stage
+        :return: summary
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'all.folded'), 'w', encoding='utf-8') as everything:
+            for stage in sorted({stage for stage, _ in self.stacks}):
+                with open(os.path.join(directory, f'{stage}.folded'), 'w', encoding='utf-8') as f:
+                    for stack, seconds in sorted(self._iter_stage_stacks(stage)):
+                        weight = round(seconds * 1e6)
+                        if not weight:
+                            continue
+                        f.write(f"{';'.join(stack)} {weight}\n")
+                        everything.write(f"{';'.join((stage,) + stack)} {weight}\n")
+        summary = self.summary(top)
+        _write_summary(directory, summary)
+        return summary
+
+
+class CProfileProfiler:
+    """
+    Deterministic profile of each stage: every thread runs one `cProfile.Profile` per stage,
+    switched on stage entry and exit, and profiles of a stage are merged when written.
+    """
+
+    mode = 'cprofile'
+
+    def __init__(self, metrics: Optional[metrics_module.Metrics] = None):
+        self.clock = StageClock(metrics)
+        self._profiles: Dict[Tuple[int, str], cProfile.Profile] = {}
+        self._running: Dict[int, List[Optional[cProfile.Profile]]] = {}
+        self._lock = threading.Lock()
+
+    def stage_entered(self, name: str) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            profile = self._profiles.setdefault((ident, name), cProfile.Profile())
+        running = self._running.setdefault(ident, [])
+        # a thread has one active profiler, time of a nested stage goes to that stage only
+        if running and running[-1] is not None:
+            running[-1].disable()
+        running.append(_enable(profile))
+
+    def stage_exited(self, name: str) -> None:
+        running = self._running.get(threading.get_ident())
+        if not running:
+            return
+        profile = running.pop()
+        if profile is not None:
+            profile.disable()
+        if running and running[-1] is not None:
+            running[-1] = _enable(running[-1])
+
+    def start(self) -> None:
+        """
+        Start listening to stages, profiling the calling thread as the main stage.
+
+        :return: None
+        """
+        self.clock.start()
+        metrics_module.stage_listeners.append(self)
+        self.stage_entered(MAIN_STAGE)
+
+    def stop(self) -> None:
+        """
+        Stop profiling.
+
+        :return: None
+        """
+        self.stage_exited(MAIN_STAGE)
+        metrics_module.stage_listeners.remove(self)
+        self.clock.stop()
+
+    def stats(self) -> Dict[str, pstats.Stats]:
+        """
+        Merge profiles of each stage.
+
+        :return: stats per stage
+        """
+        result: Dict[str, pstats.Stats] = {}
+        with self._lock:
+            profiles = list(self._profiles.items())
+        for (_, stage), profile in profiles:
+            if not profile.getstats():
+                continue
+            if stage in result:
+                result[stage].add(profile)
+            else:
+                result[stage] = pstats.Stats(profile, stream=io.StringIO())
+        return result
+
+    def summary(self, top: int = 20) -> Dict[str, Any]:
+        """
+        Summarize stages: wall time, thread-seconds by category and the hottest functions.
+
+        :param top: number of functions to list per stage
+        :return: JSON-serializable summary
+        """
+        result = {}
+        for stage, stats in sorted(self.stats().items()):
+            raw = stats.stats
+            own = {_function_label(function): row[2] for function, row in raw.items()}
+            total = {_function_label(function): row[3] for function, row in raw.items()}
+            seconds = sum(own.values())
+            categories = dict.fromkeys(CATEGORIES, 0.0)
+            for function, (_, _, _, cumulative, callers) in raw.items():
+                category = _classify_caller(function[0])
+                # outermost calls into a package only, nested ones are part of their cumulative time;
+                # waits called by HTTP or Mongo code (e.g. connection pools) belong to those
+                if category is not None and not any(
+                        _classify_caller(caller[0]) in (category, HTTP, MONGO) for caller in callers):
+                    categories[category] += cumulative
+            categories[CPU] = max(seconds - categories[HTTP] - categories[MONGO] - categories[WAIT], 0.0)
+            result[stage] = {
+                'wall_seconds': round(self.clock.seconds(stage), 3),
+                'thread_seconds': round(seconds, 3),
+                'categories': {category: round(value, 3) for category, value in categories.items()},
+                'top_self': _top(own, top),
+                'top_total': _top(total, top),
+            }
+        return {'mode': self.mode, 'stages': result}
+
+    def write(self,
+              directory: str,
+              top: int = 20) -> Dict[str, Any]:
+        """
+        Write merged profile per stage as `<stage>.pstats` for snakeviz or flameprof,
+        and the summary as `summary.json` and `summary.txt`.
+
+        :param directory: output directory, created if missing
+        :param top: number of functions to list per stage
+        :return: summary
+        """
+        os.makedirs(directory, exist_ok=True)
+        for stage, stats in self.stats().items():
+            stats.dump_stats(os.path.join(directory, f'{stage}.pstats'))
+        summary = self.summary(top)
+        _write_summary(directory, summary)
+        return summary
+
+
+def _enable(profile: cProfile.Profile) -> Optional[cProfile.Profile]:
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12+ runs one cProfile per process, concurrent stages of other threads stay unprofiled
+        return None
+    return profile
+
+
+PROFILERS = {
+    SamplingProfiler.mode: SamplingProfiler,
+    CProfileProfiler.mode: CProfileProfiler,
+}
+
+
+def _classify_caller(filename: str) -> Optional[str]:
+    if filename.endswith(_WAIT_MODULES):
+        return WAIT
+    return classify_file(filename)
+
+
+def _function_label(function: Tuple[str, int, str]) -> str:
+    filename, line, name = function
+    if filename == '~':
+        return name
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def _top(values: Dict[str, float],
+         count: int) -> List[Tuple[str, float]]:
+    ranked = sorted(values.items(), key=lambda item: item[1], reverse=True)[:count]
+    return [(label, round(value, 3)) for label, value in ranked if value]
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """
+    Render profiler summary as text, stages by time spent.
+
+    :param summary: summary of a profiler
+    :return: report text
+    """
+    lines = [f"Profile ({summary['mode']}), stage time and thread-seconds: " + ', '.join(CATEGORIES)]
+    stages = sorted(summary['stages'].items(), key=lambda item: item[1]['wall_seconds'], reverse=True)
+    for stage, data in stages:
+        shares = ', '.join(f"{category} {data['categories'][category]}" for category in CATEGORIES)
+        lines.append(f"\n{stage}: {data['wall_seconds']}s, {data['thread_seconds']} thread-s ({shares})")
+        lines.append("  self:")
+        lines += [f"    {seconds:>10} {label}" for label, seconds in data['top_self']]
+        lines.append("  total:")
+        lines += [f"    {seconds:>10} {label}" for label, seconds in data['top_total']]
+    return '\n'.join(lines) + '\n'
+
+
+def _write_summary(directory: str, summary: Dict[str, Any]) -> None:
+    with open(os.path.join(directory, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    with open(os.path.join(directory, 'summary.txt'), 'w', encoding='utf-8') as f:
+        f.write(format_summary(summary))
+    logging.info(f"Profile written to '{directory}'")
@@ -0,0 +1,127 @@
+import datetime
+import logging
+from typing import List, Optional
+
+from scripts import api, database
+from scripts.config import config
+from scripts.writer import WriteStats
+
+
+class BoardScheduler:
+    """
+    Per-board sync intervals kept in `database.BoardSchedule`, derived from the observed rate of card updates.
+
+    A board is polled about once per `target_changes` updates, never more often than `min_interval`
+    and never less often than `max_staleness`. Boards without card activity for a long time back off
+    to half of their idle time, so cold and archived boards cost almost no requests.
+    """
+
+    def __init__(self,
+                 min_interval: Optional[float] = None,
+                 max_staleness: Optional[float] = None,
+                 target_changes: Optional[float] = None,
+                 smoothing: Optional[float] = None):
+        if min_interval is None:
+            min_interval = config.SCHEDULE_MIN_INTERVAL if config.SCHEDULE_MIN_INTERVAL is not None \
+                else config.SYNC_INTERVAL
+        self.min_interval = datetime.timedelta(seconds=min_interval)
+        self.max_staleness = datetime.timedelta(
+            seconds=config.SCHEDULE_MAX_STALENESS if max_staleness is None else max_staleness
+        )
+        self.target_changes = config.SCHEDULE_TARGET_CHANGES if target_changes is None else target_changes
+        self.smoothing = config.SCHEDULE_SMOOTHING if smoothing is None else smoothing
+
+    def interval(self,
+                 rate: float,
+                 idle: datetime.timedelta) -> datetime.timedelta:
+        """
+        Compute time until the next sync of a board.
+
+        :param rate: smoothed updated cards per hour
+        :param idle: time since the last card activity on the board
+        :return: sync interval
+        """
+        interval = self.max_staleness
+        if rate > 0:
+            interval = min(interval, datetime.timedelta(hours=self.target_changes / rate))
+        interval = max(interval, idle / 2)
+        return min(max(interval, self.min_interval), self.max_staleness)
+
+    def due(self,
+            boards: List[api.InlineBoard],
+            now: Optional[datetime.datetime] = None) -> List[api.InlineBoard]:
+        """
+        Select boards whose next sync time has come, most overdue first. Boards never synced are always due.
+
+        :param boards: all boards
+        :param now: current UTC time
+        :return: boards to sync
+        """
+        now = datetime.datetime.utcnow() if now is None else now
+        next_sync = {
+            i['board_id']: i['next_sync_at'].replace(tzinfo=None)
+            for i in database.BoardSchedule.objects(board_id__in=[board.id for board in boards])
+                                           .only('board_id', 'next_sync_at').as_pymongo()
+            if i.get('next_sync_at') is not None
+        }
+        due = [board for board in boards if next_sync.get(board.id, now) <= now]
+        due.sort(key=lambda board: next_sync.get(board.id, datetime.datetime.min))
+        logging.info(f"{len(due)} of {len(boards)} board(s) due for sync")
+        return due
+
+    def record(self,
+               board_id: str,
+               stats: WriteStats,
+               started_at: Optional[datetime.datetime] = None) -> datetime.datetime:
+        """
+        Update board update rate from sync results and schedule its next sync.
+
+        The interval is counted from the start of the sync run, the same time `due` was checked at,
+        so a board scheduled `SYNC_INTERVAL` ahead is due on the next run.
+
+        :param board_id: board ID
+        :param stats: results of the sync, every counted card had new activity
+        :param started_at: UTC start time of the sync run, current time by default
+        :return: time of the next sync
+        """
+        now = datetime.datetime.utcnow() if started_at is None else started_at
+        changes = stats.matched + stats.upserted + stats.failed + stats.skipped
+        schedule = database.BoardSchedule.objects(board_id=board_id).as_pymongo().first()
+        last_activity = self._get_last_activity(board_id)
+
+        changed_at = now if changes else (schedule or {}).get('changed_at')
+        if schedule is None or schedule.get('synced_at') is None:
+            # the first sync sees every card as updated, the rate is measured from the next one
+            rate = 0.0
+            interval = self.min_interval
+        else:
+            hours = max((now - schedule['synced_at'].replace(tzinfo=None)).total_seconds() / 3600, 1 / 3600)
+            rate = self.smoothing * changes / hours + (1 - self.smoothing) * schedule.get('rate', 0.0)
+            # card dates come from Wekan, a sync which found updates is activity as well
+            active_at = max((i.replace(tzinfo=None) for i in (last_activity, changed_at) if i is not None),
+                            default=None)
+            idle = now - active_at if active_at is not None else self.max_staleness
+            interval = self.interval(rate, idle)
+
+        next_sync_at = now + interval
+        database.BoardSchedule.objects(board_id=board_id).update_one(
+            set__rate=rate,
+            set__synced_at=now,
+            set__next_sync_at=next_sync_at,
+            set__changed_at=changed_at,
+            set__last_activity=last_activity,
+            upsert=True,
+        )
+        logging.info(f"Board '{board_id}': {changes} updated card(s), {rate:.2f} per hour, next sync in {interval}")
+        return next_sync_at
+
+    @staticmethod
+    def _get_last_activity(board_id: str) -> Optional[datetime.datetime]:
+        card = database.Card.objects(board_id=board_id, last_activity__ne=None) \
+            .order_by('-last_activity').only('last_activity').as_pymongo().first()
+        if card is None:
+            return None
+        return card['last_activity'].replace(tzinfo=None)
+
+
+scheduler = BoardScheduler()
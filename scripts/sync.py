@@ -0,0 +1,241 @@
+import datetime
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from scripts import adapter, api, database, workers
+from scripts.boards import board_metadata
+from scripts.checkpoints import BoardProgress, checkpoints, is_outage
+from scripts.config import config
+from scripts.leases import leases
+from scripts.metrics import metrics
+from scripts.pipeline import Pipeline
+from scripts.schedule import scheduler
+from scripts.users import UserDirectory
+from scripts.writer import CardWriter, WriteStats
+
+
+def sync_board_pipeline(board: api.InlineBoard,
+                        token: Union[str, api.InlineToken],
+                        users: UserDirectory,
+                        progress: Optional[BoardProgress] = None) -> WriteStats:
+    """
+    Sync board with overlapping list scan, card fetch, mapping, user mapping and save stages.
+
+    A list is completed in `progress` once each of its cards is saved or dropped as not updated.
+
+    :param board: board ID (as Board object)
+    :param token: token
+    :param users: user directory
+    :param progress: lists completed so far, nothing is resumed or recorded by default
+    :return: counts of matched, upserted and failed cards
+    """
+    progress = BoardProgress(board.id, persist=False) if progress is None else progress
+    cards_state = adapter.get_cards_state_board(board)
+    metadata = board_metadata.get(board, token)
+    complete_field_id = metadata.complete_field_id
+
+    # cards of each list still in the pipeline, lists fully scanned and lists with every card through
+    in_flight: Dict[str, int] = defaultdict(int)
+    scanned: Set[str] = set()
+    ready: List[str] = []
+    lists_lock = threading.Lock()
+
+    def release(list_id: str) -> None:
+        with lists_lock:
+            in_flight[list_id] -= 1
+            if list_id in scanned and not in_flight[list_id]:
+                ready.append(list_id)
+
+    def scan(list_: api.InlineList) -> Iterator[Tuple[api.InlineList, Union[str, api.Card]]]:
+        for card in adapter.get_list_card_refs(board, list_, token):
+            with lists_lock:
+                in_flight[list_.id] += 1
+            yield list_, card
+        with lists_lock:
+            scanned.add(list_.id)
+            if not in_flight[list_.id]:
+                ready.append(list_.id)
+
+    def fetch(item: Tuple[api.InlineList, Union[str, api.Card]]) -> Iterator[Tuple[api.InlineList, api.Card]]:
+        list_, card = item
+        card = adapter.get_list_card(board, list_, card, token)
+        if card is None:
+            release(list_.id)
+            return
+        metrics.count_cards(board.id, scanned=1)
+        if adapter.is_card_updated(card, cards_state):
+            yield list_, card
+        else:
+            release(list_.id)
+
+    def map_card(item: Tuple[api.InlineList, api.Card]) -> Iterator[Tuple[str, database.Card]]:
+        list_, card = item
+        db_card = adapter.map_card_to_database(board, list_, card, complete_field_id, token)
+        metrics.count_cards(board.id, updated=1)
+        yield list_.id, db_card
+
+    def map_users(item: Tuple[str, database.Card]) -> Iterator[Tuple[str, database.Card]]:
+        list_id, card = item
+        yield list_id, adapter.map_card_users(card, users, token)
+
+    with CardWriter(fingerprints=adapter.get_cards_fingerprints(cards_state)) as writer:
+        def checkpoint() -> None:
+            # runs in the save stage only, so flush does not race with `writer.add`
+            with lists_lock:
+                completed = ready[:]
+                ready.clear()
+            if completed:
+                writer.flush()
+                for list_id in completed:
+                    progress.complete(list_id)
+
+        def save(item: Tuple[str, database.Card]) -> None:
+            list_id, card = item
+            writer.add(card)
+            release(list_id)
+            checkpoint()
+
+        Pipeline(config.PIPELINE_QUEUE_SIZE) \
+            .add_stage('list-scan', scan, config.PIPELINE_SCAN_WORKERS) \
+            .add_stage('card-fetch', fetch, config.PIPELINE_FETCH_WORKERS) \
+            .add_stage('card-map', map_card, config.PIPELINE_MAP_WORKERS) \
+            .add_stage('user-map', map_users, config.PIPELINE_USER_WORKERS) \
+            .add_stage('save', save) \
+            .run(progress.pending(metadata.lists))
+        # lists whose last cards were dropped before the save stage
+        checkpoint()
+
+    stats = writer.stats
+    logging.info(f"Board '{board.id}' saved: "
+                 f"{stats.matched} matched, {stats.upserted} upserted, {stats.failed} failed, "
+                 f"{stats.skipped} unchanged skipped")
+    return stats
+
+
+def sync_board(board: api.InlineBoard,
+               token: Union[str, api.InlineToken],
+               users: UserDirectory,
+               started_at: Optional[datetime.datetime] = None) -> WriteStats:
+    """
+    Sync updated cards of the board to database.
+
+    With `config.SYNC_LEASES` the board is skipped unless this instance claims its lease.
+
+    :param board: board ID (as Board object)
+    :param token: token
+    :param users: user directory
+    :param started_at: UTC start time of the sync run, the board's next sync is scheduled from it
+    :return: counts of matched, upserted and failed cards
+    """
+    if config.SYNC_LEASES:
+        with leases.hold(board.id) as claimed:
+            if not claimed:
+                logging.info(f"Board '{board.id}' is leased by another instance, skipped")
+                return WriteStats()
+            return _sync_board(board, token, users, started_at)
+    return _sync_board(board, token, users, started_at)
+
+
+def _sync_board(board: api.InlineBoard,
+                token: Union[str, api.InlineToken],
+                users: UserDirectory,
+                started_at: Optional[datetime.datetime] = None) -> WriteStats:
+    progress = checkpoints.board(board.id)
+    if progress is None:
+        logging.info(f"Board '{board.id}' is already synced in this run, skipped")
+        return WriteStats()
+
+    if config.SYNC_PIPELINE:
+        stats = sync_board_pipeline(board, token, users, progress)
+    else:
+        stats = sync_board_lists(board, token, users, progress)
+    progress.finish()
+    if config.SYNC_SCHEDULE:
+        scheduler.record(board.id, stats, started_at)
+    return stats
+
+
+def sync_board_lists(board: api.InlineBoard,
+                     token: Union[str, api.InlineToken],
+                     users: UserDirectory,
+                     progress: Optional[BoardProgress] = None) -> WriteStats:
+    """
+    Sync board list by list, saving cards of each list before it is completed in `progress`.
+
+    :param board: board ID (as Board object)
+    :param token: token
+    :param users: user directory
+    :param progress: lists completed so far, nothing is resumed or recorded by default
+    :return: counts of matched, upserted and failed cards
+    """
+    progress = BoardProgress(board.id, persist=False) if progress is None else progress
+    cards_state = adapter.get_cards_state_board(board)
+    metadata = board_metadata.get(board, token)
+
+    count = 0
+    with CardWriter(fingerprints=adapter.get_cards_fingerprints(cards_state)) as writer:
+        for list_ in progress.pending(metadata.lists):
+            db_cards = adapter.iter_list_updated_cards(
+                board, list_, metadata.complete_field_id, cards_state, token
+            )
+            for card in db_cards:
+                writer.add(adapter.map_card_users(card, users, token))
+                count += 1
+            writer.flush()
+            progress.complete(list_.id)
+    logging.info(f"{count} card(s) from board '{board.id}' saved: "
+                 f"{writer.stats.matched} matched, {writer.stats.upserted} upserted, {writer.stats.failed} failed")
+    if writer.stats.skipped:
+        logging.info(f"{writer.stats.skipped} unchanged card(s) from board '{board.id}' not rewritten")
+    return writer.stats
+
+
+def sync_boards(token: Union[str, api.InlineToken],
+                users: UserDirectory) -> WriteStats:
+    """
+    Sync all boards of the admin user, in `config.SYNC_PROCESSES` worker processes if it is above 1.
+
+    In worker mode a failed board is logged and does not stop the others.
+    With `config.SYNC_CHECKPOINTS` an interrupted run is resumed: synced boards and completed lists are skipped.
+    A run failing because Wekan or database is unavailable stays unfinished to be resumed, a board failing
+    for another reason loses its progress and is synced from scratch.
+    With `config.SYNC_SCHEDULE` only boards due according to their update rate are synced.
+
+    :param token: token
+    :param users: user directory
+    :return: counts of matched, upserted and failed cards
+    """
+    started_at = datetime.datetime.utcnow()
+    with metrics.stage('boards'):
+        boards = api.backend.get_boards_from_user(config.WEKAN_ADMIN_USER, token)
+    if config.SYNC_SCHEDULE:
+        boards = scheduler.due(boards, started_at)
+    stats = WriteStats()
+    checkpoints.begin()
+    if config.SYNC_PROCESSES > 1:
+        results = workers.sync_boards_parallel(boards, token, users, started_at=started_at)
+        for result in results:
+            stats += result.stats
+        failed = [result for result in results if result.error is not None]
+        if failed:
+            logging.error(f"{len(failed)} of {len(results)} board(s) failed: "
+                          f"{', '.join(result.board_id for result in failed)}")
+        checkpoints.reset(result.board_id for result in failed if not result.outage)
+        if any(result.outage for result in failed):
+            logging.warning("Wekan or database is unavailable, the sync run is left to be resumed")
+        else:
+            checkpoints.end()
+        return stats
+
+    for board in boards:
+        try:
+            stats += sync_board(board, token, users, started_at)
+        except Exception as e:
+            # the run stays unfinished, an outage is resumed where it stopped
+            if not is_outage(e):
+                checkpoints.reset([board.id])
+            raise
+    checkpoints.end()
+    return stats
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Union
+
+from scripts import api, database
+
+
+def get_user_slug(user: api.User) -> Union[str, None]:
+    """
+    Get database slug of Wekan user.
+
+    :param user: user as User object
+    :return: slug from first email or None
+    """
+    if user.emails:
+        return user.emails[0].address.split("@")[0]
+    return None
+
+
+class UserDirectory:
+    """Resolves Wekan user IDs to database users with in-memory lookups"""
+
+    def __init__(self,
+                 slugs: Dict[str, Optional[str]],
+                 db_users: Optional[Dict[str, database.User]] = None):
+        self.slugs = slugs
+        self.db_users = db_users if db_users is not None else {
+            user.slug: user for user in database.User.objects.only('slug')
+        }
+
+    def resolve(self,
+                user: Union[str, api.InlineUser, api.User],
+                token: Union[str, api.InlineToken]) -> Union[database.User, None]:
+        """
+        Get database user for Wekan user, fetching users unknown to the directory.
+
+        :param user: user ID (as string) or User object
+        :param token: token
+        :return: database user or None
+        """
+        user_id = user.id if isinstance(user, (api.InlineUser, api.User)) else user
+        if user_id not in self.slugs:
+            self.slugs[user_id] = get_user_slug(api.backend.get_user(user_id, token))
+        slug = self.slugs[user_id]
+        if slug is None:
+            return None
+        db_user = self.db_users.get(slug)
+        if db_user is None:
+            logging.warning('No such user in database.')
+        return db_user
+
+    @classmethod
+    def load_snapshot(cls,
+                      path: str,
+                      ttl: float) -> Optional['UserDirectory']:
+        """
+        Load directory from snapshot file if it is younger than `ttl`.
+
+        :param path: snapshot file path
+        :param ttl: snapshot lifetime in seconds
+        :return: directory or None
+        """
+        try:
+            with open(path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - snapshot.get('created_at', 0) > ttl:
+            return None
+        logging.info(f"Users loaded from snapshot '{path}'")
+        return cls(snapshot['slugs'])
+
+    def save_snapshot(self, path: str) -> None:
+        """
+        Save Wekan user slugs to snapshot file.
+
+        :param path: snapshot file path
+        :return: None
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'slugs': self.slugs}, f)
+        os.replace(tmp_path, path)
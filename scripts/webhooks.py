@@ -0,0 +1,257 @@
+import datetime
+import hmac
+import ipaddress
+import json
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from scripts import adapter, api
+from scripts.boards import BoardMetadata, board_metadata
+from scripts.config import config
+from scripts.daemon import Daemon
+from scripts.users import UserDirectory
+from scripts.writer import CardWriter
+
+# largest accepted webhook body in bytes, Wekan payloads are well below it
+MAX_PAYLOAD_SIZE = 64 * 1024
+
+
+def is_loopback(host: str) -> bool:
+    """
+    Check whether host only accepts connections from this machine.
+
+    :param host: host name or IP address the server binds to
+    :return: True for `localhost` and loopback addresses
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class CardQueue:
+    """Queue of cards to refresh, coalescing repeated events of the same card"""
+
+    def __init__(self):
+        self._cards: 'OrderedDict[Tuple[str, str], str]' = OrderedDict()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, board_id: str, list_id: str, card_id: str) -> None:
+        """
+        Queue card, replacing list ID of an already queued one.
+
+        :param board_id: board ID
+        :param list_id: list ID
+        :param card_id: card ID
+        :return: None
+        """
+        with self._condition:
+            self._cards[(board_id, card_id)] = list_id
+            self._condition.notify()
+
+    def get_batch(self, delay: float = 0) -> List[Tuple[str, str, str]]:
+        """
+        Wait for queued cards, then collect events arriving within `delay` seconds.
+
+        :param delay: seconds to wait for more events after the first one
+        :return: list of (board ID, list ID, card ID), empty when queue is closed
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._cards or self._closed)
+            if delay:
+                self._condition.wait_for(lambda: self._closed, timeout=delay)
+            cards = [(board_id, list_id, card_id) for (board_id, card_id), list_id in self._cards.items()]
+            self._cards.clear()
+            return cards
+
+    def close(self) -> None:
+        """
+        Wake up waiting consumers, queue returns empty batches afterwards.
+
+        :return: None
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """
+    Accepts Wekan outgoing webhook payloads with `boardId`, `listId` and `cardId`,
+    carrying the server secret in `X-Wekan-Token` or `X-Webhook-Token` header or `token` query parameter if it is set.
+    """
+
+    token_headers = ('X-Wekan-Token', 'X-Webhook-Token')
+
+    server: 'WebhookServer'
+
+    def do_POST(self) -> None:
+        if not self._is_authorized():
+            self.send_response(403)
+            self.end_headers()
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length > MAX_PAYLOAD_SIZE:
+            # the body is left unread, so the connection can't be reused
+            self.close_connection = True
+            self.send_response(413)
+            self.end_headers()
+            return
+        try:
+            if length < 0:
+                raise ValueError(f"Invalid Content-Length '{self.headers.get('Content-Length')}'")
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+        if isinstance(payload, dict) and payload.get('boardId') and payload.get('listId') and payload.get('cardId'):
+            self.server.queue.put(payload['boardId'], payload['listId'], payload['cardId'])
+        self.send_response(200)
+        self.end_headers()
+
+    def _is_authorized(self) -> bool:
+        if not self.server.secret:
+            return True
+        token = next((self.headers[header] for header in self.token_headers if header in self.headers), None)
+        if token is None:
+            token = next(iter(parse_qs(urlsplit(self.path).query).get('token', [])), '')
+        return hmac.compare_digest(token.encode(), self.server.secret.encode())
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"Webhook {self.address_string()}: {format % args}")
+
+
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self,
+                 address: Tuple[str, int],
+                 queue: CardQueue,
+                 secret: Optional[str] = None):
+        super().__init__(address, WebhookHandler)
+        self.queue = queue
+        self.secret = secret
+
+
+class WebhookReceiver:
+    """Receives Wekan webhooks and refreshes only the affected cards"""
+
+    def __init__(self,
+                 daemon: Daemon,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 secret: Optional[str] = None):
+        host = config.WEBHOOK_HOST if host is None else host
+        secret = config.WEBHOOK_SECRET if secret is None else secret
+        if not secret and not is_loopback(host):
+            raise ValueError(f"WEBHOOK_SECRET must be set to receive webhooks on '{host}', "
+                             f"only loopback hosts may accept them without a token")
+        self.daemon = daemon
+        self.queue = CardQueue()
+        self.server = WebhookServer((host, config.WEBHOOK_PORT if port is None else port), self.queue, secret)
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever, name='webhook-server', daemon=True),
+            threading.Thread(target=self._refresh_loop, name='webhook-refresh', daemon=True),
+        ]
+
+    def start(self) -> None:
+        """
+        Start HTTP server and card refresher threads.
+
+        :return: None
+        """
+        for thread in self._threads:
+            thread.start()
+        if not self.server.secret:
+            logging.warning("WEBHOOK_SECRET is not set, webhooks are accepted from any local process")
+        logging.info(f"Webhook receiver listening on {self.server.server_address[0]}:{self.server.server_address[1]}")
+
+    def stop(self) -> None:
+        """
+        Stop receiving events and wait for the refresher to finish its batch.
+
+        :return: None
+        """
+        self.server.shutdown()
+        self.queue.close()
+        for thread in self._threads:
+            thread.join()
+        self.server.server_close()
+
+    def refresh(self, cards: List[Tuple[str, str, str]]) -> int:
+        """
+        Map and save given cards, loading lists and the complete field once per board.
+
+        :param cards: list of (board ID, list ID, card ID)
+        :return: number of saved cards
+        """
+        token = self.daemon.get_token()
+        users = self.daemon.get_users()
+        started = datetime.datetime.utcnow()
+        by_board: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        for board_id, list_id, card_id in cards:
+            by_board[board_id].append((list_id, card_id))
+
+        with CardWriter() as writer:
+            for board_id, board_cards in by_board.items():
+                board = api.InlineBoard(_id=board_id, title='')
+                try:
+                    metadata = board_metadata.get(board, token)
+                except api.RouteError as e:
+                    logging.warning(e)
+                    continue
+                except Exception as e:
+                    logging.exception(f"Board '{board_id}' not refreshed: {e}")
+                    continue
+                for list_id, card_id in board_cards:
+                    # one failing card must not drop the rest of the batch
+                    try:
+                        metadata = self._refresh_card(writer, board, list_id, card_id, metadata, started, token, users)
+                    except api.RouteError as e:
+                        logging.warning(e)
+                    except Exception as e:
+                        logging.exception(f"Card '{card_id}' of board '{board_id}' not refreshed: {e}")
+        return writer.stats.matched + writer.stats.upserted
+
+    @staticmethod
+    def _refresh_card(writer: CardWriter,
+                      board: api.InlineBoard,
+                      list_id: str,
+                      card_id: str,
+                      metadata: BoardMetadata,
+                      started: datetime.datetime,
+                      token: api.InlineToken,
+                      users: UserDirectory) -> BoardMetadata:
+        lists = metadata.lists_by_id
+        card = adapter.get_list_card(board, list_id, card_id, token)
+        if card is not None and card.list_id not in lists and metadata.loaded_at < started:
+            # list created after metadata was cached
+            metadata = board_metadata.get(board, token, refresh=True)
+            lists = metadata.lists_by_id
+        if card is None or card.list_id not in lists:
+            return metadata
+        db_card = adapter.map_card_to_database(board, lists[card.list_id], card, metadata.complete_field_id, token)
+        writer.add(adapter.map_card_users(db_card, users, token))
+        return metadata
+
+    def _refresh_loop(self) -> None:
+        while True:
+            cards = self.queue.get_batch(config.WEBHOOK_DEBOUNCE)
+            if not cards:
+                return
+            try:
+                saved = self.refresh(cards)
+                logging.info(f"{saved} of {len(cards)} card(s) from webhooks refreshed")
+            except Exception as e:
+                logging.exception(e)
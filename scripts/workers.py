@@ -0,0 +1,88 @@
+import datetime
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+from scripts import api, database, sync
+from scripts.checkpoints import is_outage
+from scripts.config import config
+from scripts.metrics import metrics
+from scripts.users import UserDirectory
+from scripts.writer import WriteStats
+
+
+class BoardResult(BaseModel):
+    board_id: str
+    stats: WriteStats = WriteStats()
+    error: Optional[str] = None
+    # the error is an outage of Wekan or database, see `checkpoints.is_outage`
+    outage: bool = False
+    # `metrics.Metrics` collected while syncing the board
+    metrics: Any = None
+
+
+# user directory of the worker process, set by `_init_worker`
+_users: Optional[UserDirectory] = None
+
+
+def _init_worker(slugs: Dict[str, Optional[str]]) -> None:
+    global _users
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] [%(processName)s] %(message)s")
+    database.connect(
+        username=config.MONGO_USER,
+        password=config.MONGO_PASSWORD,
+        ip=config.MONGO_HOST,
+        port=config.MONGO_PORT,
+        db=config.MONGO_DB
+    )
+    _users = UserDirectory(slugs)
+
+
+def _sync_board(board: api.InlineBoard,
+                token: Union[str, api.InlineToken],
+                started_at: Optional[datetime.datetime] = None) -> BoardResult:
+    try:
+        stats = sync.sync_board(board, token, _users, started_at)
+        return BoardResult(board_id=board.id, stats=stats, metrics=metrics.pop())
+    except Exception as e:
+        logging.exception(e)
+        return BoardResult(board_id=board.id, error=repr(e), outage=is_outage(e), metrics=metrics.pop())
+    finally:
+        # worker processes exit without closing the store
+        api.store.flush()
+
+
+def sync_boards_parallel(boards: List[api.InlineBoard],
+                         token: Union[str, api.InlineToken],
+                         users: UserDirectory,
+                         processes: Optional[int] = None,
+                         started_at: Optional[datetime.datetime] = None) -> List[BoardResult]:
+    """
+    Sync boards in a pool of worker processes, each with its own HTTP session and database connection.
+
+    :param boards: boards to sync
+    :param token: token
+    :param users: user directory, its Wekan part is shared with workers
+    :param processes: number of worker processes, `config.SYNC_PROCESSES` by default
+    :param started_at: UTC start time of the sync run, see `sync.sync_board`
+    :return: result for each board in completion order
+    """
+    processes = config.SYNC_PROCESSES if processes is None else processes
+
+    results = []
+    with ProcessPoolExecutor(max_workers=processes,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(users.slugs,)) as executor:
+        futures = [executor.submit(_sync_board, board, token, started_at) for board in boards]
+        for future in as_completed(futures):
+            result = future.result()
+            if result.metrics is not None:
+                metrics.merge(result.metrics)
+            if result.error is not None:
+                logging.error(f"Board '{result.board_id}' failed: {result.error}")
+            results.append(result)
+    return results
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+from typing import Dict, List, Optional
+
+import bson
+from pydantic import BaseModel
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from scripts import database
+from scripts.config import config
+from scripts.metrics import metrics
+
+
+# card info fields saved by adapter, last activity is left out as it changes without changing the card
+FINGERPRINT_INFO_FIELDS = ('title', 'hours', 'timestamp', 'assignees', 'start_at', 'due_at', 'end_at', 'received_at')
+
+
+class WriteStats(BaseModel):
+    matched: int = 0
+    upserted: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+    def __add__(self, other: 'WriteStats') -> 'WriteStats':
+        return WriteStats(
+            matched=self.matched + other.matched,
+            upserted=self.upserted + other.upserted,
+            failed=self.failed + other.failed,
+            skipped=self.skipped + other.skipped,
+        )
+
+
+def get_card_fingerprint(card: database.Card) -> str:
+    """
+    Hash card fields saved by adapter, including timestamp resolved from comments and linked users.
+
+    :param card: card as database object
+    :return: hex digest
+    """
+    values = [card.status, card.completed]
+    values.extend(getattr(card.info, field, None) for field in FINGERPRINT_INFO_FIELDS)
+    values.append(sorted(str(getattr(user, 'pk', user)) for user in card.users or []))
+    return hashlib.sha1(json.dumps(values, default=str, ensure_ascii=False).encode()).hexdigest()
+
+
+class CardWriter:
+    """
+    Batched writer upserting cards by (board_id, card_id) with unordered `bulk_write`.
+
+    Fingerprints of saved cards are stored in `database.CardFingerprint`. A card matching its fingerprint
+    in `fingerprints` is not rewritten, only its last activity is updated.
+    """
+
+    def __init__(self,
+                 batch_size: Optional[int] = None,
+                 fingerprints: Optional[Dict[str, str]] = None):
+        self.batch_size = config.MONGO_BATCH_SIZE if batch_size is None else batch_size
+        self.fingerprints = fingerprints or {}
+        self.stats = WriteStats()
+        self._operations: List[UpdateOne] = []
+        self._fingerprints: List[UpdateOne] = []
+        self._touches: List[UpdateOne] = []
+
+    def __enter__(self) -> 'CardWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.flush()
+
+    def add(self, card: database.Card) -> None:
+        """
+        Queue card upsert, flushing the batch when it is full.
+
+        :param card: card as database object
+        :return: None
+        """
+        fingerprint = get_card_fingerprint(card)
+        if self.fingerprints.get(card.card_id) == fingerprint:
+            # unchanged card, last activity is still saved so it is not fetched again next time
+            self._touches.append(UpdateOne(
+                self._make_key(card),
+                {'$set': {database.Card._fields['last_activity'].db_field: card.last_activity}},
+            ))
+            self.stats.skipped += 1
+        else:
+            try:
+                self._operations.append(self._make_upsert(card))
+            except OverflowError as e:
+                logging.warning(e.args[0])
+                self.stats.failed += 1
+                return
+            self._fingerprints.append(UpdateOne(
+                {'board_id': card.board_id, 'card_id': card.card_id},
+                {'$set': {'fingerprint': fingerprint}},
+                upsert=True,
+            ))
+        if len(self._operations) + len(self._touches) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Send queued upserts to database.
+
+        :return: None
+        """
+        if not self._operations and not self._touches:
+            return
+        with metrics.stage('save'):
+            self._flush()
+
+    def _flush(self) -> None:
+        operations, self._operations = self._operations, []
+        fingerprints, self._fingerprints = self._fingerprints, []
+        touches, self._touches = self._touches, []
+        if touches:
+            try:
+                database.Card._get_collection().bulk_write(touches, ordered=False)
+            except BulkWriteError as e:
+                # card is fetched again next time, nothing is lost
+                for error in e.details.get('writeErrors', []):
+                    logging.warning(error.get('errmsg'))
+        if not operations:
+            return
+        try:
+            result = database.Card._get_collection().bulk_write(operations, ordered=False)
+            self.stats.matched += result.matched_count
+            self.stats.upserted += result.upserted_count
+        except BulkWriteError as e:
+            self.stats.matched += e.details.get('nMatched', 0)
+            self.stats.upserted += e.details.get('nUpserted', 0)
+            self.stats.failed += len(e.details.get('writeErrors', []))
+            for error in e.details.get('writeErrors', []):
+                logging.warning(error.get('errmsg'))
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+            fingerprints = [i for index, i in enumerate(fingerprints) if index not in failed]
+        # fingerprint is only a hint to skip writes, losing it costs one more write next time
+        try:
+            if fingerprints:
+                database.CardFingerprint._get_collection().bulk_write(fingerprints, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                logging.warning(error.get('errmsg'))
+
+    @staticmethod
+    def _make_upsert(card: database.Card) -> UpdateOne:
+        card.validate()
+        document = card.to_mongo().to_dict()
+        document.pop('_id', None)
+        # encode once here so values that do not fit BSON fail for this card only, as `save()` did
+        bson.encode(document)
+        return UpdateOne(CardWriter._make_key(card), {'$set': document}, upsert=True)
+
+    @staticmethod
+    def _make_key(card: database.Card) -> Dict[str, str]:
+        return {
+            database.Card._fields['board_id'].db_field: card.board_id,
+            database.Card._fields['card_id'].db_field: card.card_id,
+        }
@@ -0,0 +1,29 @@
+import os
+
+# settings the config requires, set before `scripts` is imported
+for key, value in {
+    'WEKAN_USERNAME': 'test',
+    'WEKAN_PASSWORD': 'test',
+    'WEKAN_ADMIN_USER': 'admin',
+    'WEKAN_BASE_URL': 'http://127.0.0.1:9',
+    'MONGO_USER': '',
+    'MONGO_PASSWORD': '',
+    'MONGO_HOST': 'localhost',
+    'MONGO_PORT': '27017',
+    'MONGO_DB': 'wekan_adapter_test',
+}.items():
+    os.environ.setdefault(key, value)
+
+import mongoengine
+import mongomock
+import pytest
+
+
+@pytest.fixture
+def db():
+    """In-memory database behind the adapter models, empty for every test"""
+    connection = mongoengine.connect('wekan_adapter_test', mongo_client_class=mongomock.MongoClient,
+                                     uuidRepresentation='standard')
+    yield connection
+    connection.drop_database('wekan_adapter_test')
+    mongoengine.disconnect()
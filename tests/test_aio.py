@@ -0,0 +1,30 @@
+import asyncio
+import gc
+import weakref
+
+from scripts.api import aio
+
+
+def test_transport_is_shared_within_a_loop_and_closed_with_it():
+    async def main():
+        transport = aio.get_transport()
+        assert aio.get_transport() is transport
+        await aio.close()
+        assert transport.session.closed
+        assert aio.get_transport() is not transport
+        await aio.close()
+
+    asyncio.run(main())
+
+
+def test_transport_does_not_keep_closed_loop_alive():
+    async def main():
+        aio.get_transport().session.detach()
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(main())
+    loop.close()
+    loop_ref = weakref.ref(loop)
+    del loop
+    gc.collect()
+    assert loop_ref() is None
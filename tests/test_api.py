@@ -0,0 +1,27 @@
+import json
+
+import requests
+
+from scripts import api
+from scripts.api import api as rest
+
+COMMENT = {'_id': 'm1', 'boardId': 'b1', 'cardId': 'c1', 'createdAt': '2023-01-01T00:00:00.000Z', 'userId': 'u1'}
+
+
+def test_get_comment_accepts_comment_objects(monkeypatch):
+    routes = []
+
+    def send_get(route, token, stream=False):
+        routes.append(route)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(COMMENT).encode()
+        return response
+
+    monkeypatch.setattr(rest, 'send_get', send_get)
+    card = api.InlineCard(_id='c1', title='')
+    comment = api.InlineComment(_id='m1', authorId='u1', comment='')
+
+    assert rest.get_comment('b1', card, comment, 't').id == 'm1'
+    assert rest.get_comment('b1', 'c1', 'm1', 't').id == 'm1'
+    assert routes == ['/api/boards/b1/cards/c1/comments/m1'] * 2
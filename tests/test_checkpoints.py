@@ -0,0 +1,155 @@
+import datetime
+
+import pytest
+import requests
+
+from scripts import api, database, sync
+from scripts.checkpoints import SyncCheckpoints, is_outage
+from scripts.config import config
+from scripts.writer import WriteStats
+
+LISTS = [api.InlineList(_id=f'l{i}', title='') for i in range(3)]
+
+
+def make_checkpoints(name: str = 'default', ttl: float = 3600) -> SyncCheckpoints:
+    return SyncCheckpoints(name=name, ttl=ttl, enabled=True, max_attempts=3)
+
+
+def test_disabled_checkpoints_do_not_persist(db):
+    checkpoints = SyncCheckpoints(name='default', ttl=3600, enabled=False)
+    assert checkpoints.begin() is False
+    progress = checkpoints.board('b1')
+    progress.complete('l0')
+    checkpoints.end()
+
+    assert progress.pending(LISTS) == LISTS[1:]
+    assert database.SyncRun.objects.count() == 0
+    assert database.SyncCheckpoint.objects.count() == 0
+
+
+def test_interrupted_run_resumes_completed_lists_and_boards(db):
+    checkpoints = make_checkpoints()
+    assert checkpoints.begin() is False
+    checkpoints.board('b1').finish()
+    checkpoints.board('b2').complete('l0')
+
+    # the process dies here, the next run continues
+    resumed = make_checkpoints()
+    assert resumed.begin() is True
+    assert resumed.board('b1') is None
+    assert [list_.id for list_ in resumed.board('b2').pending(LISTS)] == ['l1', 'l2']
+    assert [list_.id for list_ in resumed.board('b3').pending(LISTS)] == ['l0', 'l1', 'l2']
+
+
+def test_run_is_resumed_after_every_interruption(db):
+    make_checkpoints().begin()
+    make_checkpoints().board('b1').complete('l0')
+    assert make_checkpoints().begin() is True
+    make_checkpoints().board('b1').complete('l1')
+
+    # interrupted again, e.g. by another deploy
+    checkpoints = make_checkpoints()
+    assert checkpoints.begin() is True
+    assert [list_.id for list_ in checkpoints.board('b1').pending(LISTS)] == ['l2']
+    assert database.SyncRun.objects.get(name='default').attempts == 3
+
+
+def test_run_starts_from_scratch_after_max_attempts(db):
+    make_checkpoints().begin()
+    make_checkpoints().board('b1').complete('l0')
+    assert make_checkpoints().begin() is True
+    assert make_checkpoints().begin() is True
+
+    checkpoints = make_checkpoints()
+    assert checkpoints.begin() is False
+    assert checkpoints.board('b1').pending(LISTS) == LISTS
+    assert database.SyncRun.objects.get(name='default').attempts == 1
+
+
+def test_finished_run_starts_from_scratch(db):
+    checkpoints = make_checkpoints()
+    checkpoints.begin()
+    checkpoints.board('b1').finish()
+    checkpoints.board('b2').complete('l0')
+    checkpoints.end()
+    assert database.SyncRun.objects.get(name='default').finished_at is not None
+
+    assert checkpoints.begin() is False
+    assert checkpoints.board('b1').pending(LISTS) == LISTS
+    assert checkpoints.board('b2').pending(LISTS) == LISTS
+
+
+def test_run_older_than_ttl_is_not_resumed(db):
+    checkpoints = make_checkpoints()
+    checkpoints.begin()
+    checkpoints.board('b1').complete('l0')
+    database.SyncRun.objects(name='default').update_one(
+        set__started_at=datetime.datetime.utcnow() - datetime.timedelta(hours=2)
+    )
+
+    assert checkpoints.begin() is False
+    assert checkpoints.board('b1').pending(LISTS) == LISTS
+
+
+def test_runs_with_different_names_are_separate(db):
+    first = make_checkpoints()
+    first.begin()
+    first.board('b1').complete('l0')
+
+    second = make_checkpoints('nightly')
+    assert second.begin() is False
+    assert second.board('b1').pending(LISTS) == LISTS
+
+    assert make_checkpoints().begin() is True
+    assert make_checkpoints().board('b1').pending(LISTS) == LISTS[1:]
+
+
+@pytest.mark.parametrize('error, outage', [
+    (requests.ConnectionError(), True),
+    (api.RouteError('/api/boards/b2', 503), True),
+    (api.RouteError('/api/boards/b2', 429), True),
+    (api.RouteError('/api/boards/b2', 404), False),
+    (ValueError(), False),
+])
+def test_is_outage(error, outage):
+    assert is_outage(error) is outage
+
+
+def sync_failing_board(monkeypatch, error: Exception) -> SyncCheckpoints:
+    checkpoints = make_checkpoints()
+    boards = [api.InlineBoard(_id=board_id, title='') for board_id in ('b1', 'b2', 'b3')]
+
+    def sync_board(board, token, users, started_at=None):
+        progress = checkpoints.board(board.id)
+        progress.complete('l0')
+        if board.id == 'b2':
+            raise error
+        progress.finish()
+        return WriteStats()
+
+    monkeypatch.setattr(sync, 'checkpoints', checkpoints)
+    monkeypatch.setattr(sync, 'sync_board', sync_board)
+    monkeypatch.setattr(api.backend, 'get_boards_from_user', lambda user, token: boards)
+    monkeypatch.setattr(config, 'SYNC_PROCESSES', 1)
+    monkeypatch.setattr(config, 'SYNC_SCHEDULE', False)
+    with pytest.raises(type(error)):
+        sync.sync_boards('token', None)
+    return checkpoints
+
+
+def test_outage_leaves_run_to_be_resumed(db, monkeypatch):
+    checkpoints = sync_failing_board(monkeypatch, api.RouteError('/api/boards/b2', 502))
+
+    assert database.SyncRun.objects.get(name='default').finished_at is None
+    assert checkpoints.begin() is True
+    assert checkpoints.board('b1') is None
+    assert [list_.id for list_ in checkpoints.board('b2').pending(LISTS)] == ['l1', 'l2']
+
+
+def test_failing_board_restarts_while_others_resume(db, monkeypatch):
+    checkpoints = sync_failing_board(monkeypatch, ValueError('bad card'))
+
+    assert database.SyncRun.objects.get(name='default').finished_at is None
+    assert checkpoints.begin() is True
+    assert checkpoints.board('b1') is None
+    assert checkpoints.board('b2').pending(LISTS) == LISTS
@@ -0,0 +1,72 @@
+import datetime
+
+import pydantic
+import pytest
+
+from scripts import api
+from scripts.api import decoding
+from scripts.config import config
+
+CARD = {
+    '_id': 'c1',
+    'title': 'Card',
+    'description': 'not read',
+    'assignees': ['u1'],
+    'receivedAt': '2023-01-01T10:00:00.000Z',
+    'dueAt': None,
+    'createdAt': '2023-01-01T09:00:00.000Z',
+    'dateLastActivity': '2023-01-02T09:00:00.000Z',
+    'boardId': 'b1',
+    'listId': 'l1',
+    'spentTime': '3',
+    'customFields': [{'_id': 'f1', 'value': True}, {'_id': 'f2', 'value': None}],
+    'unknownField': 1,
+}
+
+
+def test_construct_matches_validation_of_read_fields():
+    trusted = decoding.construct(api.Card, CARD)
+    validated = api.Card(**CARD)
+    assert trusted == validated
+    assert trusted.date_last_activity == datetime.datetime(2023, 1, 2, 9, tzinfo=datetime.timezone.utc)
+    assert trusted.spent_time == 3
+    assert trusted.start_at is None
+    assert isinstance(trusted.custom_fields[0], api.CustomFieldValue)
+    assert trusted.custom_fields[0].id == 'f1'
+
+
+def test_construct_takes_unread_fields_as_is():
+    user = decoding.construct(api.User, {'_id': 'u1', 'username': 7, 'emails': [{'address': 'a@b', 'verified': 'x'}]})
+    assert user.username == 7
+    assert user.emails[0].address == 'a@b'
+    assert user.emails[0].verified == 'x'
+
+
+@pytest.mark.parametrize('data', [
+    dict(CARD, boardId=None),
+    dict(CARD, createdAt='yesterday'),
+    {key: value for key, value in CARD.items() if key != 'listId'},
+])
+def test_construct_raises_validation_errors_of_read_fields(data):
+    with pytest.raises(pydantic.ValidationError):
+        decoding.construct(api.Card, data)
+
+
+def test_parse_validates_unless_decoding_is_trusted(monkeypatch):
+    comment = {'_id': 'm1', 'authorId': 5, 'comment': 'text'}
+    monkeypatch.setattr(config, 'WEKAN_TRUSTED_DECODING', False)
+    assert decoding.parse(api.InlineComment, comment).author_id == '5'
+
+    monkeypatch.setattr(config, 'WEKAN_TRUSTED_DECODING', True)
+    assert [i.author_id for i in decoding.parse_list(api.InlineComment, [comment])] == [5]
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_iter_items_decodes_array_split_across_chunks(monkeypatch, streaming):
+    if not streaming:
+        monkeypatch.setattr(decoding, 'ijson', None)
+    elif decoding.ijson is None:
+        pytest.skip('ijson is not installed')
+    body = b'[{"_id": "c1", "sort": 1.5}, {"_id": "c2"}, {"_id": "c3", "title": "\xd0\xb2"}]'
+    chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+    assert list(decoding.iter_items(chunks)) == [{'_id': 'c1', 'sort': 1.5}, {'_id': 'c2'}, {'_id': 'c3', 'title': 'в'}]
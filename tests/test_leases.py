@@ -0,0 +1,87 @@
+import datetime
+import time
+
+import pytest
+
+from scripts import database
+from scripts.leases import BoardLeases
+
+
+def make_leases(owner: str, ttl: float = 60, window: float = 0) -> BoardLeases:
+    return BoardLeases(owner=owner, ttl=ttl, window=window)
+
+
+def expire(board_id: str) -> None:
+    database.BoardLease.objects(board_id=board_id).update_one(
+        set__expires_at=datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    )
+
+
+def test_claim_is_exclusive_until_lease_expires(db):
+    first, second = make_leases('first'), make_leases('second')
+    assert first.claim('b1')
+    assert first.claim('b1')
+    assert not second.claim('b1')
+    assert second.claim('b2')
+
+    expire('b1')
+    assert second.claim('b1')
+    assert database.BoardLease.objects.get(board_id='b1').owner == 'second'
+
+
+def test_stolen_lease_is_not_renewed_by_previous_owner(db):
+    first, second = make_leases('first'), make_leases('second')
+    first.claim('b1')
+    expire('b1')
+    second.claim('b1')
+
+    assert not first.renew('b1')
+    first.release('b1', synced=True)
+    lease = database.BoardLease.objects.get(board_id='b1')
+    assert lease.owner == 'second' and lease.synced_at is None
+    assert second.renew('b1')
+
+
+def test_recently_synced_board_is_not_claimed_within_window(db):
+    first, second = make_leases('first', window=60), make_leases('second', window=60)
+    first.claim('b1')
+    first.release('b1', synced=True)
+
+    assert not second.claim('b1')
+    assert not first.claim('b1')
+    database.BoardLease.objects(board_id='b1').update_one(
+        set__synced_at=datetime.datetime.utcnow() - datetime.timedelta(minutes=2)
+    )
+    assert second.claim('b1')
+
+
+def test_hold_renews_lease_until_block_exits(db):
+    first, second = make_leases('first', ttl=0.3), make_leases('second', ttl=0.3)
+    with first.hold('b1') as claimed:
+        assert claimed
+        heartbeat_at = database.BoardLease.objects.get(board_id='b1').heartbeat_at
+        time.sleep(0.5)
+        lease = database.BoardLease.objects.get(board_id='b1')
+        assert lease.heartbeat_at > heartbeat_at
+        assert not second.claim('b1')
+
+    lease = database.BoardLease.objects.get(board_id='b1')
+    assert lease.synced_at is not None
+    assert second.claim('b1')
+
+
+def test_hold_releases_failed_board_without_marking_it_synced(db):
+    first, second = make_leases('first', window=60), make_leases('second', window=60)
+    with pytest.raises(ValueError):
+        with first.hold('b1'):
+            raise ValueError('sync failed')
+
+    assert database.BoardLease.objects.get(board_id='b1').synced_at is None
+    assert second.claim('b1')
+
+
+def test_hold_yields_false_for_board_held_elsewhere(db):
+    make_leases('first').claim('b1')
+    with make_leases('second').hold('b1') as claimed:
+        assert not claimed
+    assert database.BoardLease.objects.get(board_id='b1').owner == 'first'
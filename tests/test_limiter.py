@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+
+from scripts.api.limiter import AdaptiveLimiter, Limiter, TokenBucket
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    wait = bucket.try_acquire()
+    assert 0 < wait <= 0.1
+
+
+def test_token_bucket_without_rate_never_waits():
+    bucket = TokenBucket(rate=0)
+    assert all(bucket.try_acquire() == 0 for _ in range(100))
+
+
+def test_adaptive_limiter_halves_on_overload_and_grows_back():
+    limiter = AdaptiveLimiter(minimum=2, maximum=8)
+    limiter.acquire()
+    limiter.release(0.1, 200)
+    assert limiter.limit == 8
+
+    limiter.acquire()
+    limiter.release(0.1, 503)
+    assert limiter.limit == 4
+
+    for _ in range(8):
+        limiter.acquire()
+        limiter.release(0.1, 200)
+    assert 5 < limiter.limit < 8
+
+
+def test_adaptive_limiter_does_not_go_below_minimum():
+    limiter = AdaptiveLimiter(minimum=2, maximum=4)
+    for status in (429, None, 500):
+        limiter.acquire()
+        limiter._decreased_at = 0
+        limiter.release(0.1, status)
+    assert limiter.limit == 2
+
+
+def test_adaptive_limiter_caps_requests_in_flight():
+    limiter = AdaptiveLimiter(minimum=1, maximum=2)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release(0.1, 200)
+    assert limiter.try_acquire()
+
+
+def test_async_acquire_shares_slots_with_threads():
+    limiter = Limiter(min_concurrency=1, max_concurrency=1)
+    limiter.acquire()
+
+    async def main():
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.02)
+        assert not waiter.done()
+        limiter.release(0.01, 200)
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(main())
+    assert limiter.concurrency._inflight == 1
+
+
+def test_async_waiters_are_woken_by_release_from_another_thread():
+    limiter = Limiter(min_concurrency=2, max_concurrency=2)
+    limiter.acquire()
+    limiter.acquire()
+
+    async def main():
+        waiters = [asyncio.ensure_future(limiter.acquire_async()) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        threading.Thread(target=limiter.release, args=(0.01, 200)).start()
+        done, pending = await asyncio.wait(waiters, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+        assert len(done) == 1 and len(pending) == 1
+        for waiter in pending:
+            waiter.cancel()
+
+    asyncio.run(main())
+    assert limiter.concurrency._inflight == 2
+    assert limiter.concurrency._waiters == []
+
+
+def test_cancelled_async_acquire_frees_its_slot():
+    limiter = Limiter(rate=1, burst=1, min_concurrency=1, max_concurrency=1)
+    limiter.bucket.try_acquire()
+
+    async def main():
+        # takes the slot, then waits for the bucket
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        assert limiter.concurrency._inflight == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(main())
+    assert limiter.concurrency._inflight == 0
+    assert limiter.concurrency.limit == 1
@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+from scripts.pipeline import Pipeline
+
+
+def test_items_pass_through_every_stage():
+    results = []
+    lock = threading.Lock()
+
+    def save(item):
+        with lock:
+            results.append(item)
+
+    Pipeline(queue_size=2) \
+        .add_stage('split', lambda n: range(n)) \
+        .add_stage('square', lambda n: [n * n], workers=4) \
+        .add_stage('save', save) \
+        .run([1, 2, 3])
+    assert sorted(results) == [0, 0, 0, 1, 1, 4]
+
+
+def test_stages_run_concurrently():
+    def slow(item):
+        time.sleep(0.1)
+        return [item]
+
+    started = time.monotonic()
+    Pipeline().add_stage('slow', slow, workers=8).add_stage('drop', lambda item: None).run(range(8))
+    assert time.monotonic() - started < 0.5
+
+
+@pytest.mark.parametrize('failing_stage', [0, 1, 2])
+def test_first_error_stops_pipeline_and_is_raised(failing_stage):
+    processed = []
+
+    def stage(index):
+        def func(item):
+            if index == failing_stage and item == 3:
+                raise ValueError(f'stage {index} failed')
+            if index == 2:
+                processed.append(item)
+            return [item]
+        return func
+
+    pipeline = Pipeline(queue_size=1)
+    for index in range(3):
+        pipeline.add_stage(f'stage-{index}', stage(index), workers=2)
+
+    # input is far larger than the queues, a stuck stage would block forever
+    with pytest.raises(ValueError, match=f'stage {failing_stage} failed'):
+        pipeline.run(range(10000))
+    assert len(processed) < 10000
@@ -0,0 +1,74 @@
+import datetime
+
+from scripts import api, database
+from scripts.schedule import BoardScheduler
+from scripts.writer import WriteStats
+
+NOW = datetime.datetime(2023, 1, 1)
+HOUR = datetime.timedelta(hours=1)
+
+
+def make_scheduler() -> BoardScheduler:
+    return BoardScheduler(min_interval=300, max_staleness=86400, target_changes=5, smoothing=0.5)
+
+
+def test_interval_follows_update_rate_within_bounds():
+    scheduler = make_scheduler()
+    assert scheduler.interval(0, datetime.timedelta(0)) == datetime.timedelta(days=1)
+    assert scheduler.interval(10, datetime.timedelta(0)) == datetime.timedelta(minutes=30)
+    assert scheduler.interval(1000, datetime.timedelta(0)) == datetime.timedelta(minutes=5)
+
+
+def test_interval_backs_off_on_idle_boards():
+    scheduler = make_scheduler()
+    assert scheduler.interval(10, datetime.timedelta(hours=4)) == datetime.timedelta(hours=2)
+    assert scheduler.interval(10, datetime.timedelta(days=400)) == datetime.timedelta(days=1)
+
+
+def test_due_boards_include_unscheduled_and_overdue_most_overdue_first(db):
+    boards = [api.InlineBoard(_id=board_id, title='') for board_id in ('new', 'later', 'late', 'latest')]
+    for board_id, next_sync_at in (('later', NOW + HOUR), ('late', NOW - HOUR), ('latest', NOW - 2 * HOUR)):
+        database.BoardSchedule(board_id=board_id, next_sync_at=next_sync_at).save()
+
+    assert [board.id for board in make_scheduler().due(boards, NOW)] == ['new', 'latest', 'late']
+
+
+def test_record_measures_rate_from_the_second_sync(db):
+    scheduler = make_scheduler()
+
+    # the first sync sees every card as updated
+    assert scheduler.record('b1', WriteStats(upserted=100), NOW) == NOW + datetime.timedelta(minutes=5)
+    assert database.BoardSchedule.objects.get(board_id='b1').rate == 0
+
+    next_sync_at = scheduler.record('b1', WriteStats(matched=8, skipped=2), NOW + HOUR)
+    schedule = database.BoardSchedule.objects.get(board_id='b1')
+    assert schedule.rate == 5
+    assert next_sync_at == NOW + 2 * HOUR
+    assert schedule.next_sync_at == next_sync_at
+
+
+def test_record_slows_down_boards_without_changes(db):
+    scheduler = make_scheduler()
+    scheduler.record('b1', WriteStats(upserted=10), NOW)
+    scheduler.record('b1', WriteStats(matched=10), NOW + HOUR)
+
+    intervals = []
+    now = NOW + HOUR
+    for _ in range(4):
+        next_sync_at = scheduler.record('b1', WriteStats(), now)
+        intervals.append(next_sync_at - now)
+        now = next_sync_at
+    assert intervals == sorted(intervals)
+    assert intervals[-1] > intervals[0]
+
+
+def test_board_at_minimum_interval_is_due_on_the_next_run(db):
+    scheduler = make_scheduler()
+    board = api.InlineBoard(_id='b1', title='')
+    tick = datetime.timedelta(seconds=300)
+
+    # the run starts at NOW and finishes later, the next run starts SYNC_INTERVAL after NOW
+    for run in range(3):
+        started_at = NOW + run * tick
+        assert [board.id for board in scheduler.due([board], started_at)] == ['b1']
+        assert scheduler.record('b1', WriteStats(upserted=100), started_at) == started_at + tick
@@ -0,0 +1,93 @@
+import sqlite3
+import time
+
+import pytest
+
+from scripts.api.store import OFF, RECORD, REPLAY, ResponseStore, parse_ttls
+
+LISTS = '/api/boards/b1/lists'
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'responses.sqlite3')
+
+
+def committed(path: str) -> int:
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+def test_parse_ttls():
+    assert parse_ttls('') == {}
+    assert parse_ttls('/api/boards/{id}/lists=600, /api/users/{id}=86400') == {
+        '/api/boards/{id}/lists': 600,
+        '/api/users/{id}': 86400,
+    }
+    with pytest.raises(ValueError):
+        parse_ttls('/api/users')
+
+
+def test_unknown_mode_is_rejected(path):
+    with pytest.raises(ValueError):
+        ResponseStore(path, mode='replay-all')
+
+
+def test_recorded_responses_are_replayed(path):
+    recorder = ResponseStore(path, mode=RECORD)
+    assert recorder.records(LISTS)
+    recorder.save(LISTS, 200, b'[{"_id": "l1"}]')
+    recorder.close()
+
+    replay = ResponseStore(path, mode=REPLAY)
+    assert not replay.records(LISTS)
+    response = replay.get(LISTS).to_response()
+    assert (response.status_code, response.json()) == (200, [{'_id': 'l1'}])
+    assert replay.get('/api/boards/b2/lists') is None
+    replay.close()
+
+
+def test_only_successful_responses_are_saved(path):
+    store = ResponseStore(path, mode=RECORD)
+    store.save(LISTS, 503, b'busy')
+    store.save('/api/boards/b2', 404, b'')
+    store.save('/api/boards/b3', 204, b'')
+    store.close()
+    assert committed(path) == 1
+    replay = ResponseStore(path, mode=REPLAY)
+    assert replay.get(LISTS) is None
+    replay.close()
+
+
+def test_saves_are_committed_in_batches(path):
+    store = ResponseStore(path, mode=RECORD, batch_size=3)
+    for index in range(4):
+        store.save(f'/api/boards/b{index}', 200, b'{}')
+    assert committed(path) == 3
+
+    store.flush()
+    assert committed(path) == 4
+    store.close()
+
+
+def test_routes_with_ttl_are_served_while_fresh(path):
+    store = ResponseStore(path, ttls=parse_ttls('/api/boards/{id}/lists=60'))
+    assert store.enabled and store.records(LISTS)
+    assert not store.records('/api/boards/b1')
+    assert store.get(LISTS) is None
+
+    store.save(LISTS, 200, b'[]')
+    assert store.get(LISTS).body == b'[]'
+
+    with sqlite3.connect(path) as connection:
+        store.flush()
+        connection.execute('UPDATE responses SET stored_at = ?', (time.time() - 120,))
+    assert store.get(LISTS) is None
+    store.close()
+
+
+def test_disabled_store(path):
+    store = ResponseStore(path, mode=OFF)
+    assert not store.enabled
+    assert not store.records(LISTS)
+    assert store.get(LISTS) is None
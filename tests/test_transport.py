@@ -0,0 +1,58 @@
+import pytest
+import requests
+
+from scripts.api.limiter import Limiter
+from scripts.api.transport import Transport
+
+
+class RecordingLimiter(Limiter):
+    def __init__(self):
+        super().__init__()
+        self.statuses = []
+
+    def release(self, latency, status):
+        self.statuses.append(status)
+        super().release(latency, status)
+
+
+class FakeSession:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def request(self, method, url, **kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response._content = b''
+        response._content_consumed = True
+        return response
+
+
+def make_transport(outcomes, retries=2):
+    limiter = RecordingLimiter()
+    transport = Transport('http://wekan', retries=retries, backoff=0, limiter=limiter)
+    transport.session = FakeSession(outcomes)
+    return transport, limiter
+
+
+def test_transport_retries_pass_the_limiter_once_per_attempt():
+    transport, limiter = make_transport([503, requests.ConnectionError(), 200])
+    assert transport.request('GET', '/api/boards').status_code == 200
+    assert limiter.statuses == [503, None, 200]
+    assert limiter.concurrency._inflight == 0
+
+
+def test_transport_returns_last_response_when_retries_run_out():
+    transport, limiter = make_transport([429, 429, 429])
+    assert transport.request('GET', '/api/boards').status_code == 429
+    assert limiter.statuses == [429, 429, 429]
+
+
+def test_transport_raises_connection_error_when_retries_run_out():
+    transport, limiter = make_transport([requests.ConnectionError(), requests.Timeout()], retries=1)
+    with pytest.raises(requests.Timeout):
+        transport.request('GET', '/api/boards')
+    assert limiter.statuses == [None, None]
+    assert limiter.concurrency._inflight == 0
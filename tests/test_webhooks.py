@@ -0,0 +1,96 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from scripts.webhooks import MAX_PAYLOAD_SIZE, CardQueue, WebhookReceiver, WebhookServer, is_loopback
+
+CARD = {'boardId': 'b1', 'listId': 'l1', 'cardId': 'c1'}
+
+
+@pytest.fixture
+def server():
+    server = WebhookServer(('127.0.0.1', 0), CardQueue(), secret='s3cret')
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def post(server: WebhookServer, body: bytes, path: str = '/', headers: dict = None) -> int:
+    connection = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        connection.request('POST', path, body=body, headers=headers or {})
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+def queued(server: WebhookServer):
+    server.queue.close()
+    return server.queue.get_batch()
+
+
+@pytest.mark.parametrize('host, loopback', [
+    ('127.0.0.1', True),
+    ('::1', True),
+    ('localhost', True),
+    ('0.0.0.0', False),
+    ('', False),
+    ('adapter', False),
+])
+def test_is_loopback(host, loopback):
+    assert is_loopback(host) is loopback
+
+
+def test_receiver_refuses_exposed_host_without_secret():
+    with pytest.raises(ValueError, match='WEBHOOK_SECRET'):
+        WebhookReceiver(daemon=None, host='0.0.0.0', port=0, secret='')
+
+
+@pytest.mark.parametrize('path, headers', [
+    ('/', {'X-Wekan-Token': 's3cret'}),
+    ('/', {'X-Webhook-Token': 's3cret'}),
+    ('/?token=s3cret', {}),
+])
+def test_authorized_card_is_queued(server, path, headers):
+    assert post(server, json.dumps(CARD).encode(), path, headers) == 200
+    assert queued(server) == [('b1', 'l1', 'c1')]
+
+
+@pytest.mark.parametrize('path, headers', [
+    ('/', {}),
+    ('/', {'X-Wekan-Token': 'wrong'}),
+    ('/?token=wrong', {}),
+])
+def test_unauthorized_request_is_rejected(server, path, headers):
+    assert post(server, json.dumps(CARD).encode(), path, headers) == 403
+    assert queued(server) == []
+
+
+def test_oversized_body_is_rejected(server):
+    body = json.dumps(dict(CARD, text='x' * MAX_PAYLOAD_SIZE)).encode()
+    assert post(server, body, headers={'X-Wekan-Token': 's3cret'}) == 413
+    assert queued(server) == []
+
+
+def test_invalid_and_unrelated_payloads(server):
+    headers = {'X-Wekan-Token': 's3cret'}
+    assert post(server, b'{not json', headers=headers) == 400
+    assert post(server, json.dumps({'boardId': 'b1'}).encode(), headers=headers) == 200
+    assert post(server, json.dumps([CARD]).encode(), headers=headers) == 200
+    assert queued(server) == []
+
+
+def test_queue_coalesces_events_of_the_same_card():
+    queue = CardQueue()
+    queue.put('b1', 'l1', 'c1')
+    queue.put('b1', 'l2', 'c2')
+    queue.put('b1', 'l3', 'c1')
+    assert queue.get_batch() == [('b1', 'l3', 'c1'), ('b1', 'l2', 'c2')]
+
+    queue.close()
+    assert queue.get_batch() == []
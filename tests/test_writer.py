@@ -0,0 +1,60 @@
+import datetime
+
+from scripts import adapter, api, database
+from scripts.writer import CardWriter, get_card_fingerprint
+
+BOARD = api.InlineBoard(_id='b1', title='')
+LIST = api.InlineList(_id='l1', title='в работе')
+NOW = datetime.datetime(2023, 1, 1)
+
+
+def make_card(card_id: str = 'c1', **fields) -> database.Card:
+    values = dict(_id=card_id, title='Card', createdAt=NOW, dateLastActivity=NOW, boardId='b1', listId='l1',
+                  assignees=[], customFields=[])
+    values.update(fields)
+    return adapter.map_card_fields(BOARD, LIST, api.Card(**values), 'f1')
+
+
+def stored_fingerprints() -> dict:
+    return adapter.get_cards_fingerprints(adapter.get_cards_state_board(BOARD))
+
+
+def test_fingerprint_follows_saved_fields_only():
+    card = make_card()
+    assert get_card_fingerprint(make_card(dateLastActivity=NOW + datetime.timedelta(days=1))) == \
+        get_card_fingerprint(card)
+    assert get_card_fingerprint(make_card(title='Renamed')) != get_card_fingerprint(card)
+    assert get_card_fingerprint(make_card(customFields=[{'_id': 'f1', 'value': True}])) != \
+        get_card_fingerprint(card)
+
+    card.info.timestamp = NOW
+    assert get_card_fingerprint(card) != get_card_fingerprint(make_card())
+
+
+def test_unchanged_cards_are_not_rewritten(db):
+    with CardWriter() as writer:
+        writer.add(make_card('c1'))
+        writer.add(make_card('c2'))
+    assert (writer.stats.upserted, writer.stats.skipped) == (2, 0)
+    assert set(stored_fingerprints()) == {'c1', 'c2'}
+
+    later = NOW + datetime.timedelta(hours=1)
+    with CardWriter(fingerprints=stored_fingerprints()) as writer:
+        writer.add(make_card('c1', dateLastActivity=later))
+        writer.add(make_card('c2', title='Renamed', dateLastActivity=later))
+    assert (writer.stats.matched, writer.stats.upserted, writer.stats.skipped) == (1, 0, 1)
+
+    # last activity of the skipped card is still saved, so it is not fetched again
+    assert database.Card.objects.get(card_id='c1').last_activity == later
+    assert database.Card.objects.get(card_id='c2').info.title == 'Renamed'
+    assert stored_fingerprints()['c2'] == get_card_fingerprint(make_card('c2', title='Renamed'))
+
+
+def test_writer_flushes_full_batches(db):
+    writer = CardWriter(batch_size=2)
+    for index in range(3):
+        writer.add(make_card(f'c{index}'))
+    assert database.Card.objects.count() == 2
+    writer.flush()
+    assert database.Card.objects.count() == 3
+    assert writer.stats.upserted == 3